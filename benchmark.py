@@ -0,0 +1,279 @@
+"""
+Measures interface.py against synthetic histories, so that it getting slower shows up here before it shows up as the
+launcher window taking its time.
+
+  python benchmark.py [suite] [--sizes 100x5000,1000x50000] [--repeat 5] [--json results.jsonl]
+    time loading, the launcher, adding and undoing time and each report, for each goals x rows size.  --json writes
+    one JSON object per measurement, - for stdout, so that runs can be compared.
+  python benchmark.py compare [goals] [rows]
+    compare ways of holding the same history in memory
+"""
+import os
+import sys
+import gc
+import io
+import json
+import time
+import shutil
+import random
+import decimal
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+
+import interface
+
+DESCRIPTIONS = ["sleep", "eat", "shower", "travel", "clean", "email", "write code", "read paper. with notes", "meeting"]
+TAGS = ["meta", "lin", "vr", "work"]
+ONE_DAY = 24*60*60
+
+def generate_history(directory, goal_count, row_count, seed=1):
+  """Write goal_count goals with row_count progress rows between them, ending now, into directory/goals"""
+  random.seed(seed)
+  os.makedirs(os.path.join(directory, "goals"), exist_ok=True)
+  now = time.time()
+  goals = []
+  for i in range(goal_count):
+    if i < len(DESCRIPTIONS):
+      description = DESCRIPTIONS[i]
+    else:
+      description = "task %d. something" % i
+    if description == "sleep":
+      tags = ["sleep"]
+    elif i < 5:
+      tags = ["upkeep"]
+    else:
+      tags = [random.choice(TAGS)]
+    completed_at = None
+    if i > 20 and i % 3 == 0:
+      completed_at = str(now - 30*ONE_DAY)
+    goals.append({"id": i, "description": description, "tags": tags, "progress": [],
+      "created_at": str(now - 400*ONE_DAY), "completed_at": completed_at, "last_saved_at": None,
+      "requires": [], "value_components": {"default": ["1", "1"]}, "cost_components": {},
+      "time_components": {"default": [str(random.randint(1, 5)), "5"]}, "format_version": interface.GOAL_FORMAT_VERSION})
+  #rows are laid end to end, counting back from now, with a long sleep every night
+  start = now - 600 - row_count * 45 * 60
+  for i in range(row_count):
+    duration = random.randint(5, 85) * 60
+    if random.random() < 0.6:
+      goal = random.choice(goals[:len(DESCRIPTIONS)])
+    else:
+      goal = random.choice(goals)
+    if time.localtime(start).tm_hour == 23:
+      goal = goals[0]
+      duration = 8*60*60
+    row = [str(round(start, 3)), str(round(start + duration, 3)), "1", random.choice(["", "", "note %d" % i])]
+    goal["progress"].append(row)
+    #now and then two goals were worked on at once
+    if random.random() < 0.03:
+      random.choice(goals)["progress"].append([row[0], row[1], "0.5", ""])
+    start += duration
+  for goal in goals:
+    file_name = os.path.join(directory, interface.Goal.file_name_from_id(goal["id"]))
+    out_file = open(file_name, "w")
+    out_file.write("thoughts\n" + interface.Goal.THOUGHT_SEPARATOR + "\n" + json.dumps(goal, indent=2))
+    out_file.close()
+    #a real goals folder has mostly old files, and the snapshot won't trust ones written moments ago
+    os.utime(file_name, (now - ONE_DAY, now - ONE_DAY))
+  out_file = open(os.path.join(directory, interface.Goal.ID_FILE), "w")
+  out_file.write(str(goal_count))
+  out_file.close()
+
+def measure(function, *args):
+  """(seconds, peak bytes allocated, result) for one call"""
+  gc.collect()
+  tracemalloc.start()
+  start = time.perf_counter()
+  result = function(*args)
+  seconds = time.perf_counter() - start
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return seconds, peak, result
+
+class DictEntry():
+  """Entry as it was before it had __slots__, to compare against"""
+  __init__ = interface.Entry.__init__
+
+def make_entries(goals, entry_class):
+  return [entry_class(row, goal) for goal in goals for row in goal.progress]
+
+def to_milliseconds(goals):
+  """Every row as a tuple of integer milliseconds and integer thousandths of focus"""
+  return [(int(row[0] * 1000), int(row[1] * 1000), int(row[2] * 1000), row[3]) for goal in goals for row in goal.progress]
+
+def total_decimal_effort(goals):
+  total = decimal.Decimal(0)
+  for goal in goals:
+    for row in goal.progress:
+      total += (row[1] - row[0]) * row[2]
+  return total
+
+def total_millisecond_effort(rows):
+  total = 0
+  for start, end, focus, notes in rows:
+    total += (end - start) * focus
+  #back to seconds only once, at the end
+  return decimal.Decimal(total) / 1000000
+
+def compare_representations(goals):
+  """
+  Rows of (name, seconds, peak bytes) for each way of holding the same history.  Integer milliseconds are only
+  measured here, rows are kept as Decimal seconds: summing them is only a little faster, and converting every row
+  first costs several times what it saves, along with a second copy of the history.
+  """
+  results = []
+  seconds, peak, entries = measure(make_entries, goals, DictEntry)
+  results.append(("entries with a dict", seconds, peak))
+  del entries
+  seconds, peak, entries = measure(make_entries, goals, interface.Entry)
+  results.append(("entries with __slots__", seconds, peak))
+  del entries
+  seconds, peak, decimal_total = measure(total_decimal_effort, goals)
+  results.append(("sum effort, Decimal seconds", seconds, peak))
+  seconds, peak, rows = measure(to_milliseconds, goals)
+  results.append(("convert rows to integer ms", seconds, peak))
+  seconds, peak, millisecond_total = measure(total_millisecond_effort, rows)
+  results.append(("sum effort, integer ms", seconds, peak))
+  #millisecond rounding is the price of the compact form, so say how much it moved the answer
+  results.append(("difference in total effort (s)", abs(decimal_total - millisecond_total), 0))
+  return results
+
+def print_results(results):
+  print("%s %12s %14s" % (interface.pad("", 32), "seconds", "peak KiB"))
+  for name, seconds, peak in results:
+    print("%s %12.4f %14.1f" % (interface.pad(name, 32), seconds, peak / 1024.0))
+
+def compare(args):
+  goal_count = 3000
+  row_count = 200000
+  if len(args) > 0:
+    goal_count = int(args[0])
+  if len(args) > 1:
+    row_count = int(args[1])
+  directory = tempfile.mkdtemp(prefix="timelogger-benchmark-")
+  previous_directory = os.getcwd()
+  try:
+    generate_history(directory, goal_count, row_count)
+    os.chdir(directory)
+    goals = list(interface.load_all_goals(use_cache=False).values())
+    print("%s goals, %s rows" % (len(goals), sum(len(goal.progress) for goal in goals)))
+    print_results(compare_representations(goals))
+  finally:
+    os.chdir(previous_directory)
+    shutil.rmtree(directory, ignore_errors=True)
+
+DEFAULT_SIZES = [(100, 5000), (1000, 50000), (3000, 200000)]
+
+def time_repeatedly(function, repeat):
+  """Seconds for each of repeat calls, with anything function prints thrown away"""
+  times = []
+  for i in range(repeat):
+    with contextlib.redirect_stdout(io.StringIO()):
+      start = time.perf_counter()
+      function()
+      times.append(time.perf_counter() - start)
+  return times
+
+def time_add_and_undo(goal_dict, repeat):
+  """Seconds for each add_time and each /undo, the way the launcher does them, on the same goal"""
+  add_times = []
+  undo_times = []
+  goals = list(goal_dict.values())
+  for i in range(repeat):
+    recent_entries = interface.get_multi_entries_since(goals, interface.NOW - interface.one_day_in_seconds)
+    prev_entry = recent_entries[-1] if len(recent_entries) > 0 else None
+    with contextlib.redirect_stdout(io.StringIO()):
+      start = time.perf_counter()
+      new_entry = interface.add_time("write code, 5, benchmark", goal_dict, prev_entry)
+      add_times.append(time.perf_counter() - start)
+      start = time.perf_counter()
+      for entry in new_entry.entries:
+        entry.goal.undo_add_time()
+      undo_times.append(time.perf_counter() - start)
+  return add_times, undo_times
+
+def load_serially():
+  workers = interface.LOAD_WORKERS
+  interface.LOAD_WORKERS = 0
+  try:
+    return interface.load_all_goals(use_cache=False)
+  finally:
+    interface.LOAD_WORKERS = workers
+
+def run_size(goal_count, row_count, repeat):
+  """{name: [seconds, ...]} for everything the suite times, against a fresh history of the given size"""
+  directory = tempfile.mkdtemp(prefix="timelogger-benchmark-")
+  previous_directory = os.getcwd()
+  try:
+    generate_history(directory, goal_count, row_count)
+    os.chdir(directory)
+    results = {}
+    results["load_all_goals_uncached"] = time_repeatedly(lambda: interface.load_all_goals(use_cache=False), repeat)
+    results["load_all_goals_uncached_serial"] = time_repeatedly(lambda: load_serially(), repeat)
+    #the first load builds the snapshot, the rest use it
+    results["load_all_goals"] = time_repeatedly(lambda: interface.load_all_goals(), repeat)
+    goal_dict = interface.load_all_goals()
+    goals = list(goal_dict.values())
+    results["launcher"] = time_repeatedly(lambda: interface.show_launcher(set(), goals), repeat)
+    results["add_time"], results["undo"] = time_add_and_undo(goal_dict, repeat)
+    results["review"] = time_repeatedly(lambda: interface.review(goals, "1"), repeat)
+    results["simple"] = time_repeatedly(lambda: interface.simple_review(goals, "3"), repeat)
+    results["weekly"] = time_repeatedly(lambda: interface.weekly_review(goals, "7"), repeat)
+    results["sum"] = time_repeatedly(lambda: interface.summarize(goals, "7 0"), repeat)
+    results["sumtag"] = time_repeatedly(lambda: interface.summarize(goals, "7 0", for_tags=True), repeat)
+    return results
+  finally:
+    os.chdir(previous_directory)
+    shutil.rmtree(directory, ignore_errors=True)
+
+def suite(args):
+  sizes = DEFAULT_SIZES
+  repeat = 5
+  json_file_name = None
+  while len(args) > 0:
+    arg = args.pop(0)
+    if arg == "--sizes":
+      sizes = [tuple(int(count) for count in size.split("x")) for size in args.pop(0).split(",")]
+    elif arg == "--repeat":
+      repeat = int(args.pop(0))
+    elif arg == "--json":
+      json_file_name = args.pop(0)
+    else:
+      print("Unknown option %s" % arg)
+      sys.exit(2)
+  json_file = None
+  if json_file_name == "-":
+    json_file = sys.stdout
+  elif json_file_name != None:
+    json_file = open(json_file_name, "a")
+  #the same for every record, so that results from different machines and versions can be told apart
+  run_info = {"time": time.time(), "python": platform.python_version(), "platform": platform.platform(), "storage": interface.STORAGE}
+  if json_file != sys.stdout:
+    print("%s %12s %12s %12s" % (interface.pad("", 48), "first", "min", "median"))
+  for goal_count, row_count in sizes:
+    results = run_size(goal_count, row_count, repeat)
+    for name, times in results.items():
+      ordered = sorted(times)
+      record = dict(run_info)
+      record.update({"benchmark": name, "goals": goal_count, "rows": row_count, "repeat": repeat,
+        "first": times[0], "min": ordered[0], "median": ordered[len(ordered)//2], "times": times})
+      if json_file != None:
+        json_file.write(json.dumps(record, sort_keys=True) + "\n")
+      if json_file != sys.stdout:
+        label = "%s (%s x %s)" % (name, goal_count, row_count)
+        print("%s %12.4f %12.4f %12.4f" % (interface.pad(label, 48), record["first"], record["min"], record["median"]))
+  if json_file != None and json_file != sys.stdout:
+    json_file.close()
+
+def main():
+  args = sys.argv[1:]
+  if len(args) > 0 and args[0] == "compare":
+    compare(args[1:])
+  else:
+    if len(args) > 0 and args[0] == "suite":
+      args = args[1:]
+    suite(args)
+
+if __name__ == "__main__":
+  main()
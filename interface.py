@@ -5,9 +5,30 @@ import os
 import sys
 import decimal
 import json
+import csv
 import time
 import glob
 import datetime
+import pickle
+import bisect
+import array
+import struct
+import itertools
+import heapq
+import collections
+import traceback
+import tempfile
+import contextlib
+import functools
+import atexit
+try:
+  import fcntl
+except ImportError:
+  #windows
+  fcntl = None
+  import msvcrt
+#optional, and imported on first use because it is too slow to import for every launch
+numpy = None
 
 INPUT_SEPARATOR = ","
 NOW = decimal.Decimal(str(time.time()))
@@ -74,7 +95,17 @@ def read_map(message):
       data[split_data[0].strip()] = read_min_max(split_data[1].strip())
   return data
       
-def _convert_values_to_decimal(data):
+#the shape goal files are written in.  Files from before 2 may have short progress rows and single value components,
+#newer ones are loaded without checking for either, see --migrate-format
+GOAL_FORMAT_VERSION = 2
+
+def _convert_values_to_decimal(data, format_version=1):
+  if format_version >= 2:
+    #always [min, max]
+    for value in data.values():
+      value[0] = decimal.Decimal(value[0])
+      value[1] = decimal.Decimal(value[1])
+    return
   for key in data:
     #TODO:  remove this once everything is converted
     if isinstance(data[key], list):
@@ -83,6 +114,24 @@ def _convert_values_to_decimal(data):
       newVal = [decimal.Decimal(data[key]), decimal.Decimal(data[key])]
     data[key] = newVal
     
+def _convert_progress(progress, format_version=1):
+  if format_version >= 2:
+    #every row is already [start, end, focus, notes], so the numbers are converted where they are
+    for row in progress:
+      row[0] = decimal.Decimal(row[0])
+      row[1] = decimal.Decimal(row[1])
+      row[2] = decimal.Decimal(row[2])
+    return progress
+  real_progress = []
+  for data in progress:
+    if len(data) == 2:
+      data.append(1)
+    if len(data) == 3:
+      data.append("")
+    start, end, focus, notes = data
+    real_progress.append([decimal.Decimal(start), decimal.Decimal(end), decimal.Decimal(focus), notes])
+  return real_progress
+
 def _serializer(object):
   if isinstance(object, decimal.Decimal):
     return str(object)
@@ -119,24 +168,1153 @@ def parse_time_from_user(user_data, last_recorded_time):
     duration = NOW - last_recorded_time
   return duration
 
-def load_all_goals():
+SNAPSHOT_FILE = "goals/goals.snapshot"
+SNAPSHOT_VERSION = 5
+#files modified this close to when the snapshot is written might change again without their mtime moving
+SNAPSHOT_RACY_SECONDS = 2
+
+#when set, only goal headers stay in memory, progress and thoughts are read from the file when first used
+LAZY_LOADING = False
+#how many goals may have their progress and thoughts loaded at once when loading lazily
+LAZY_CACHE_SIZE = 200
+#goals whose progress and thoughts are loaded, least recently used first
+_loaded_bodies = collections.OrderedDict()
+
+def _touch_loaded_body(goal):
+  if goal.id in _loaded_bodies:
+    _loaded_bodies.move_to_end(goal.id)
+    return
+  _loaded_bodies[goal.id] = goal
+  if len(_loaded_bodies) <= LAZY_CACHE_SIZE:
+    return
+  for goal_id in list(_loaded_bodies.keys()):
+    if len(_loaded_bodies) <= LAZY_CACHE_SIZE:
+      break
+    #journaled or batched progress is not in the file yet, so it has to stay in memory
+    if goal_id in _journal_goals or goal_id == goal.id or (_deferred_saves != None and goal_id in _deferred_saves):
+      continue
+    _loaded_bodies.pop(goal_id)._unload_body()
+
+#lock files, one per goal plus a few for shared files, so that several launches at once don't step on each other
+LOCK_DIRECTORY = "goals/locks"
+
+class FileLock():
+  """An exclusive lock on file_name, shared with every other process that locks the same file, for use in a with"""
+  def __init__(self, file_name):
+    self.file_name = file_name
+    self.lock_file = None
+
+  def __enter__(self):
+    os.makedirs(os.path.dirname(self.file_name), exist_ok=True)
+    self.lock_file = open(self.file_name, "a+")
+    if fcntl != None:
+      fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+    else:
+      while True:
+        try:
+          self.lock_file.seek(0)
+          msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_LOCK, 1)
+          break
+        except OSError:
+          #LK_LOCK only retries for ten seconds, keep waiting
+          continue
+    return self
+
+  def __exit__(self, *args):
+    if fcntl != None:
+      fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+      self.lock_file.seek(0)
+      msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    self.lock_file.close()
+    self.lock_file = None
+
+def _replace_file(file_name, data):
+  """
+  Write data to file_name by writing it to the side and renaming it over the top, so that a concurrent reader sees
+  either the old file or the new one and never half of one
+  """
+  temp_file_name = "%s.%s.tmp" % (file_name, os.getpid())
+  out_file = open(temp_file_name, "wb" if isinstance(data, bytes) else "w")
+  out_file.write(data)
+  out_file.close()
+  os.replace(temp_file_name, file_name)
+
+def get_goal_file_names():
+  return [file_name.replace("\\", "/") for file_name in glob.glob("goals/*.json")]
+
+def _get_file_signature(file_name):
+  stat = os.stat(file_name)
+  #every save renames a new file into place, so the inode changes even when the mtime can't tell
+  return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _read_snapshot():
+  """
+  Returns {file_name: (signature, goal state)} and {view name: state} from the snapshot file,
+  or two empty dicts if it is missing or unusable
+  """
+  try:
+    in_file = open(SNAPSHOT_FILE, "rb")
+    try:
+      version, entries, views = pickle.load(in_file)
+    finally:
+      in_file.close()
+  except Exception:
+    return {}, {}
+  if version != SNAPSHOT_VERSION:
+    return {}, {}
+  return entries, views
+
+def _write_snapshot(entries, views):
+  _replace_file(SNAPSHOT_FILE, pickle.dumps((SNAPSHOT_VERSION, entries, views), pickle.HIGHEST_PROTOCOL))
+
+def _load_goal_files(use_cache=True):
+  """Load every goal file, only re-parsing the files that changed since the snapshot was written"""
+  global _title_index
   goals = {}
-  for file_name in glob.glob("goals/*.json"):
-    file_name = file_name.replace("\\", "/")
-    goal = Goal.load_from_file(file_name)
+  snapshot = {}
+  snapshot_views = {}
+  if use_cache:
+    snapshot, snapshot_views = _read_snapshot()
+  new_snapshot = {}
+  #ids of goals that are not the same as in the snapshot
+  changed_ids = set()
+  _loaded_files.clear()
+  snapshot_changed = False
+  racy_time = (time.time() - SNAPSHOT_RACY_SECONDS) * 1e9
+  file_names = get_goal_file_names()
+  signatures = dict((file_name, _get_file_signature(file_name)) for file_name in file_names)
+  #everything the snapshot can't answer for is read first, so that it can be read in parallel
+  parsed = _read_goal_files([file_name for file_name in file_names
+    if file_name not in snapshot or snapshot[file_name][0] != signatures[file_name]])
+  for file_name in file_names:
+    signature = signatures[file_name]
+    cached = snapshot.pop(file_name, None)
+    if file_name not in parsed:
+      goal = Goal()
+      goal.__dict__.update(cached[1])
+    else:
+      goal = parsed[file_name]
+      snapshot_changed = True
+      changed_ids.add(goal.id)
+    _loaded_files[file_name] = (signature, goal.id)
+    if signature[0] >= racy_time:
+      #dont trust this one next time, it can still change within the same mtime tick
+      signature = None
+    new_snapshot[file_name] = (signature, goal.get_snapshot_state())
     goals[goal.id] = goal
+  #anything left over was deleted
+  for signature, state in snapshot.values():
+    changed_ids.add(state["id"])
+  reset_derived_views()
+  if use_cache:
+    title_state = snapshot_views.get("titles")
+    if title_state != None:
+      _title_index = TitleIndex(goals, title_state, changed_ids)
+    if snapshot_changed or snapshot or title_state == None:
+      _write_snapshot(new_snapshot, {"titles": get_title_index(goals).get_state()})
+  _loaded_bodies.clear()
+  forget_archive()
+  #the snapshot only ever holds what is in the goal files, journaled progress goes on top
+  replay_journal(goals)
   return goals
+
+#processes to parse goal files in when there is no snapshot to load from, 0 to parse them here, None for one per core
+LOAD_WORKERS = None
+#fewer files than this to parse are not worth starting processes for
+PARALLEL_LOAD_MINIMUM = 200
+
+def _parse_goal_files(file_names):
+  """Goals from each of file_names, in a worker process"""
+  return [Goal.read_file(file_name) for file_name in file_names]
+
+def _read_goal_files(file_names, workers=None):
+  """{file_name: goal} for each of file_names, spread over LOAD_WORKERS processes when there are enough of them"""
+  if workers == None:
+    workers = LOAD_WORKERS
+  if workers == None:
+    workers = os.cpu_count() or 1
+  if workers <= 1 or len(file_names) < PARALLEL_LOAD_MINIMUM:
+    goals = [Goal.load_from_file(file_name) for file_name in file_names]
+  else:
+    import concurrent.futures
+    #a few chunks per worker keeps them all busy without pickling every goal on its own
+    chunk_size = max(1, len(file_names) // (workers * 4))
+    chunks = [file_names[i:i+chunk_size] for i in range(0, len(file_names), chunk_size)]
+    goals = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+      #map hands back results in order, and re-raises the first error, which names its file
+      for chunk_goals in executor.map(_parse_goal_files, chunks):
+        goals += chunk_goals
+    if LAZY_LOADING:
+      for goal in goals:
+        goal._unload_body()
+  return dict(zip(file_names, goals))
+
+#when set, add_time and undo_add_time append a small record to the journal instead of rewriting the whole goal file
+USE_PROGRESS_JOURNAL = False
+JOURNAL_FILE = "goals/progress.journal"
+#{goal id: [[sequence number, progress signature], ...]} for goals that compaction is folding the journal into.  A goal
+#file whose signature is in there already holds every record up to that sequence number
+JOURNAL_MARKS_FILE = "goals/progress.journal.marks"
+#fold the journal back into the goal files once it has this many records
+JOURNAL_COMPACT_AT = 200
+#goal files as they were when loaded or last saved by us, {file_name: (signature, goal id)}
+_loaded_files = {}
+
+#goals with records in the journal, by id, so that compaction knows what to rewrite
+_journal_goals = {}
+_journal_last_seq = 0
+_journal_record_count = 0
+_journal_signature = None
+
+def _get_journal_signature():
+  if not os.path.exists(JOURNAL_FILE):
+    return None
+  return _get_file_signature(JOURNAL_FILE)
+
+def _read_last_journal_seq():
+  """Sequence number of the last whole record in the journal, or 0 if there isn't one"""
+  if not os.path.exists(JOURNAL_FILE):
+    return 0
+  in_file = open(JOURNAL_FILE, "rb")
+  size = in_file.seek(0, 2)
+  #only the end of the file is read, going further back for as long as it takes to find a whole record
+  tail_size = 4096
+  while True:
+    in_file.seek(max(0, size - tail_size))
+    lines = in_file.read().split(b"\n")
+    if size > tail_size:
+      #the first line is cut off
+      lines = lines[1:]
+    for line in reversed(lines):
+      try:
+        seq = json.loads(line)["seq"]
+      except (ValueError, KeyError):
+        continue
+      in_file.close()
+      return seq
+    if size <= tail_size:
+      in_file.close()
+      return 0
+    tail_size *= 4
+
+def _next_journal_seq():
+  #must be called with the journal locked, so that sequence numbers increase in the order that records are written,
+  #whichever process writes them, see _get_replayed_seq
+  global _journal_last_seq
+  _journal_last_seq = max(_journal_last_seq + 1, _read_last_journal_seq() + 1, int(time.time() * 1000000))
+  return _journal_last_seq
+
+def _apply_journal_record(goal, record):
+  if record["op"] == "add":
+    start, end, focus, notes = record["row"]
+    goal.progress.append([decimal.Decimal(start), decimal.Decimal(end), decimal.Decimal(focus), notes])
+    goal._sign_row(len(goal.progress)-1, 1)
+    if record.get("completed_at"):
+      goal.completed_at = decimal.Decimal(record["completed_at"])
+  elif record["op"] == "undo" and len(goal.progress) > 0:
+    row = goal.progress.pop()
+    goal._effort_sums = None
+    goal._start_order = None
+    goal._sign_row(len(goal.progress), -1, row)
+  goal._journal_seq = record["seq"]
+
+def _read_journal_records():
+  records = []
+  in_file = open(JOURNAL_FILE, "r")
+  for line in in_file:
+    line = line.strip()
+    if not line:
+      continue
+    try:
+      records.append(json.loads(line))
+    except ValueError:
+      #a torn final line from a process that died mid-append, everything before it is still good
+      continue
+  in_file.close()
+  return records
+
+def _read_journal_marks():
+  if not os.path.exists(JOURNAL_MARKS_FILE):
+    return {}
+  in_file = open(JOURNAL_MARKS_FILE, "r")
+  marks = json.loads(in_file.read())
+  in_file.close()
+  return dict((int(goal_id), goal_marks) for goal_id, goal_marks in marks.items())
+
+def _get_replayed_seq(goal, marks):
+  """Sequence number of the last journal record that goal already has, going by what is in memory and its file"""
+  seq = goal._journal_seq
+  signature = goal.get_progress_signature()
+  for mark_seq, mark_signature in marks.get(goal.id, []):
+    if mark_signature == signature:
+      seq = max(seq, mark_seq)
+  return seq
+
+def replay_journal(goals):
+  """Apply every journal record that is newer than what the goal file already contains"""
+  global _journal_last_seq, _journal_record_count, _journal_signature
+  _journal_goals.clear()
+  _journal_record_count = 0
+  _journal_signature = _get_journal_signature()
+  if _journal_signature == None:
+    return
+  marks = _read_journal_marks()
+  for record in _read_journal_records():
+    _journal_record_count += 1
+    _journal_last_seq = max(_journal_last_seq, record["seq"])
+    goal = goals.get(record["id"])
+    if goal == None:
+      continue
+    if goal.id not in _journal_goals:
+      #before any of its records are applied, while it is still what was read from its file
+      goal._journal_seq = _get_replayed_seq(goal, marks)
+      _journal_goals[goal.id] = goal
+    if record["seq"] <= goal._journal_seq:
+      continue
+    _apply_journal_record(goal, record)
+
+def append_journal_record(goal, record):
+  global _journal_record_count, _journal_signature
+  record["id"] = goal.id
+  #so that a compaction in another process can't drop the journal out from under this record, and so that nobody
+  #else can write a record between this one getting its sequence number and getting written
+  with FileLock(LOCK_DIRECTORY + "/journal.lock"):
+    record["seq"] = _next_journal_seq()
+    if not os.path.exists(JOURNAL_FILE) and os.path.exists(JOURNAL_MARKS_FILE):
+      #left by a compaction that died after dropping the journal, and about nothing that is still in one
+      os.remove(JOURNAL_MARKS_FILE)
+    out_file = open(JOURNAL_FILE, "a")
+    out_file.write(json.dumps(record, default=_serializer, sort_keys=True) + "\n")
+    out_file.close()
+  _journal_signature = _get_journal_signature()
+  goal._journal_seq = record["seq"]
+  _journal_goals[goal.id] = goal
+  _journal_record_count += 1
+  if _journal_record_count >= JOURNAL_COMPACT_AT:
+    compact_journal()
+
+def compact_journal():
+  """Rewrite every goal that has journaled progress, then drop the journal"""
+  global _journal_record_count, _journal_signature
+  storage = get_storage()
+  with FileLock(LOCK_DIRECTORY + "/journal.lock"):
+    #other processes may have journaled rows that we never saw, or saved goals since we loaded them, so every goal
+    #is read again and gets every record of its own that its file doesn't have yet
+    records = {}
+    if os.path.exists(JOURNAL_FILE):
+      for record in _read_journal_records():
+        records.setdefault(record["id"], []).append(record)
+    marks = _read_journal_marks()
+    for goal_id in sorted(records.keys()):
+      with storage.lock_goal(goal_id):
+        if not storage.has_goal(goal_id):
+          continue
+        goal = storage.reload_goal(goal_id)
+        goal._journal_seq = _get_replayed_seq(goal, marks)
+        for record in records[goal_id]:
+          if record["seq"] > goal._journal_seq:
+            _apply_journal_record(goal, record)
+        #marked before the file is written, with the signature of what is about to be written, save stamp and all, so
+        #that dying at any point is harmless
+        goal.last_saved_at = NOW
+        marks.setdefault(goal_id, []).append([goal._journal_seq, goal.get_progress_signature()])
+        _replace_file(JOURNAL_MARKS_FILE, json.dumps(dict((str(mark_id), goal_marks) for mark_id, goal_marks in marks.items()), sort_keys=True))
+        goal._write()
+      loaded = _journal_goals.get(goal_id)
+      if loaded != None:
+        changed = loaded.get_progress_signature() != goal.get_progress_signature()
+        loaded.__dict__.update(goal.__dict__)
+        if changed:
+          #the views were built from what we had before
+          reset_derived_views()
+    _journal_goals.clear()
+    _journal_record_count = 0
+    if os.path.exists(JOURNAL_FILE):
+      os.remove(JOURNAL_FILE)
+    if os.path.exists(JOURNAL_MARKS_FILE):
+      os.remove(JOURNAL_MARKS_FILE)
+  _journal_signature = None
+
+def _refresh_goal_files(goal_dict):
+  """Bring an already loaded goal_dict up to date with the files, re-parsing only the goal files that changed"""
+  changed = _get_journal_signature() != _journal_signature
+  file_names = get_goal_file_names()
+  for file_name in file_names:
+    signature = _get_file_signature(file_name)
+    known = _loaded_files.get(file_name)
+    if known != None and known[0] == signature:
+      continue
+    goal = Goal.load_from_file(file_name)
+    if known != None and known[1] != goal.id:
+      goal_dict.pop(known[1], None)
+    goal_dict[goal.id] = goal
+    _loaded_files[file_name] = (signature, goal.id)
+    changed = True
+  for file_name in set(_loaded_files.keys()).difference(file_names):
+    goal_dict.pop(_loaded_files.pop(file_name)[1], None)
+    changed = True
+  if changed:
+    #goals still in memory already have their journal records applied, so this only touches re-parsed ones
+    replay_journal(goal_dict)
+    reset_derived_views()
+    forget_archive()
+
+def rebuild_snapshot():
+  """Throw away the snapshot, rebuild it from the goal files, and report how long loading takes with and without it"""
+  if os.path.exists(SNAPSHOT_FILE):
+    os.remove(SNAPSHOT_FILE)
+  start = time.time()
+  goals = load_all_goals(use_cache=False)
+  uncached_time = time.time() - start
+  start = time.time()
+  load_all_goals()
+  build_time = time.time() - start
+  start = time.time()
+  load_all_goals()
+  cached_time = time.time() - start
+  print("Loaded %s goals" % len(goals))
+  print("without cache:   %.3fs" % uncached_time)
+  print("building cache:  %.3fs" % build_time)
+  print("with cache:      %.3fs" % cached_time)
   
+#where goals are kept, "json" for a directory of goal files or "sqlite" for a single database, see migrate_storage
+STORAGE = "json"
+SQLITE_FILE = "goals/goals.sqlite3"
+
+class GoalStorage():
+  """
+  Where goals are kept.  Besides loading and saving, a storage answers the range and total queries that the reports
+  make, so that one that can search its rows doesn't have to hand every goal's whole history to Python first.
+  """
+  def get_next_id(self):
+    raise NotImplementedError()
+
+  def set_next_id(self, next_id):
+    raise NotImplementedError()
+
+  def allocate_id(self):
+    """The next id, which is then used up, atomically with respect to other processes"""
+    raise NotImplementedError()
+
+  def lock_goal(self, goal_id):
+    """A lock to hold while reading, changing and writing back one goal, for use in a with"""
+    return FileLock(LOCK_DIRECTORY + "/" + str(goal_id) + ".lock")
+
+  def has_changed(self, goal):
+    """Whether another process saved goal since we loaded or saved it ourselves"""
+    raise NotImplementedError()
+
+  def reload_goal(self, goal_id):
+    """One goal as it is stored right now"""
+    raise NotImplementedError()
+
+  def has_goal(self, goal_id):
+    """Whether goal_id is stored at all, eg. not deleted by hand"""
+    raise NotImplementedError()
+
+  def load_all_goals(self, use_cache=True):
+    """{id: goal} for every goal, with the derived views reset and the journal applied"""
+    raise NotImplementedError()
+
+  def refresh_goals(self, goal_dict):
+    """Bring an already loaded goal_dict up to date with changes made by other processes"""
+    raise NotImplementedError()
+
+  def load_body(self, goal_id):
+    """(progress, thoughts) of one goal"""
+    raise NotImplementedError()
+
+  def save_goal(self, goal):
+    raise NotImplementedError()
+
+  def open_for_edit(self, goal):
+    """Name of a goal file holding goal, for the user to edit"""
+    raise NotImplementedError()
+
+  def finish_edit(self, file_name):
+    """The goal from a file handed out by open_for_edit, after the user is done with it, stored again"""
+    raise NotImplementedError()
+
+  def get_rows_after(self, goals, start_time):
+    """(row, goal) for every row starting strictly after start_time, by start, then by the goal's place in goals"""
+    return list(self.iter_rows_after(goals, start_time))
+
+  def iter_rows_after(self, goals, start_time, reverse=False):
+    """The same rows as get_rows_after, one at a time, latest first if reverse"""
+    return merge_rows_after(goals, start_time, reverse)
+
+  def get_rows_in_period(self, goals, start_time, end_time):
+    """(row, goal) for every row that starts and ends within the period, in order"""
+    return _get_rows_in_period_from_memory(goals, start_time, end_time)
+
+  def iter_rows_in_period(self, goals, start_time, end_time):
+    """The same rows as get_rows_in_period, one at a time, for when there could be years of them"""
+    if _use_interval_file():
+      return get_packed_intervals(goals).iter_rows_in_period(goals, start_time, end_time)
+    return get_interval_index(goals).iter_rows_in_period(start_time, end_time)
+
+  def get_durations_by_goal(self, goals, start_time, end_time):
+    """{goal: total duration} over the rows that get_rows_in_period would return"""
+    return _get_goal_durations_in_memory(goals, start_time, end_time)
+
+class JsonDirectoryStorage(GoalStorage):
+  """One goal file per goal in goals/, which is how goals have always been kept"""
+  def get_next_id(self):
+    inFile = open(Goal.ID_FILE, "r")
+    nextId = int(inFile.read().strip())
+    inFile.close()
+    return nextId
+
+  def set_next_id(self, next_id):
+    _replace_file(Goal.ID_FILE, str(next_id))
+
+  def allocate_id(self):
+    with FileLock(LOCK_DIRECTORY + "/next.id.lock"):
+      next_id = self.get_next_id()
+      self.set_next_id(next_id + 1)
+    return next_id
+
+  def has_changed(self, goal):
+    file_name = Goal.file_name_from_id(goal.id)
+    if not os.path.exists(file_name):
+      return False
+    known = _loaded_files.get(file_name)
+    return known == None or known[0] != _get_file_signature(file_name)
+
+  def reload_goal(self, goal_id):
+    file_name = Goal.file_name_from_id(goal_id)
+    signature = _get_file_signature(file_name)
+    goal = Goal.load_from_file(file_name)
+    _loaded_files[file_name] = (signature, goal.id)
+    return goal
+
+  def has_goal(self, goal_id):
+    return os.path.exists(Goal.file_name_from_id(goal_id))
+
+  def load_all_goals(self, use_cache=True):
+    return _load_goal_files(use_cache)
+
+  def refresh_goals(self, goal_dict):
+    _refresh_goal_files(goal_dict)
+
+  def load_body(self, goal_id):
+    in_file = open(Goal.file_name_from_id(goal_id), "r")
+    data = in_file.read()
+    in_file.close()
+    thoughts, jsonData = data.split(Goal.THOUGHT_SEPARATOR)
+    obj = json.loads(jsonData)
+    return _convert_progress(obj["progress"], obj.get("format_version", 1)), thoughts.strip()
+
+  def save_goal(self, goal):
+    file_name = Goal.file_name_from_id(goal.id)
+    _replace_file(file_name, goal.get_file_text())
+    _loaded_files[file_name] = (_get_file_signature(file_name), goal.id)
+
+  def open_for_edit(self, goal):
+    return Goal.file_name_from_id(goal.id)
+
+  def finish_edit(self, file_name):
+    return Goal.load_from_file(file_name)
+
+class SqliteStorage(GoalStorage):
+  """
+  Goals in one SQLite database.  The goals table has each goal's header as the same JSON that a goal file holds
+  (without progress) and its thoughts, and progress has one row per progress row.  start_time and end_time are in
+  integer microseconds so that range queries and totals can be answered by the database, and exact keeps the
+  original decimal text of start, end and focus so that nothing is lost on the way through.
+
+  Only goal headers are read up front, progress and thoughts are read when first used.
+  """
+  SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS goals (id INTEGER PRIMARY KEY, header TEXT NOT NULL, thoughts TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS progress (goal_id INTEGER NOT NULL, row_number INTEGER NOT NULL, "
+      "start_time INTEGER NOT NULL, end_time INTEGER NOT NULL, focus REAL NOT NULL, notes TEXT NOT NULL, "
+      "exact TEXT NOT NULL, PRIMARY KEY (goal_id, row_number))",
+    "CREATE INDEX IF NOT EXISTS progress_by_start ON progress (start_time, end_time)",
+    "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)",
+  ]
+  _save_counter = itertools.count()
+
+  def __init__(self, file_name=SQLITE_FILE):
+    self.file_name = file_name
+    self.connection = None
+    #what PRAGMA data_version said when we last loaded, it moves whenever another connection commits
+    self.data_version = None
+
+  def _connect(self):
+    if self.connection == None:
+      #imported here so that people keeping goal files don't pay for it on every launch
+      import sqlite3
+      #other processes only hold the database for the length of one save, but wait for them rather than fail
+      self.connection = sqlite3.connect(self.file_name, timeout=60)
+      with self.connection:
+        for statement in SqliteStorage.SCHEMA:
+          self.connection.execute(statement)
+    return self.connection
+
+  def _get_data_version(self):
+    return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+  def _has_unsaved_progress(self):
+    #journaled and batched rows are only in memory, so the database can't answer for them yet
+    return len(_journal_goals) > 0 or (_deferred_saves != None and len(_deferred_saves) > 0)
+
+  @staticmethod
+  def _parse_row(exact, notes):
+    start, end, focus = json.loads(exact)
+    return [decimal.Decimal(start), decimal.Decimal(end), decimal.Decimal(focus), notes]
+
+  def get_next_id(self):
+    row = self._connect().execute("SELECT value FROM settings WHERE name = 'next_id'").fetchone()
+    if row == None:
+      return 0
+    return int(row[0])
+
+  def set_next_id(self, next_id):
+    connection = self._connect()
+    with connection:
+      connection.execute("INSERT OR REPLACE INTO settings (name, value) VALUES ('next_id', ?)", (str(next_id),))
+
+  def allocate_id(self):
+    connection = self._connect()
+    #the first statement writes, so the whole transaction holds the write lock and nobody can read in between
+    with connection:
+      connection.execute("INSERT OR IGNORE INTO settings (name, value) VALUES ('next_id', '0')")
+      connection.execute("UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE name = 'next_id'")
+      next_id = int(connection.execute("SELECT value FROM settings WHERE name = 'next_id'").fetchone()[0])
+    return next_id - 1
+
+  @staticmethod
+  def _goal_from_header(header):
+    goal = Goal()
+    #headers from before there was a version
+    goal.format_version = 1
+    for key, value in json.loads(header).items():
+      setattr(goal, key, value)
+    goal._progress = None
+    goal._thoughts = None
+    goal._rows_signed = False
+    goal._finish_load()
+    return goal
+
+  def has_changed(self, goal):
+    row = self._connect().execute("SELECT header FROM goals WHERE id = ?", (goal.id,)).fetchone()
+    if row == None:
+      return False
+    header = json.loads(row[0])
+    if "_save_stamp" in header:
+      return header["_save_stamp"] != goal._save_stamp
+    #saved before there were stamps, when every save was only marked with the saving process's NOW, which processes
+    #started together can share
+    last_saved_at = header.get("last_saved_at")
+    if last_saved_at == None:
+      return goal.last_saved_at != None
+    return goal.last_saved_at != decimal.Decimal(last_saved_at)
+
+  def reload_goal(self, goal_id):
+    header = self._connect().execute("SELECT header FROM goals WHERE id = ?", (goal_id,)).fetchone()[0]
+    goal = SqliteStorage._goal_from_header(header)
+    goal._progress, goal._thoughts = self.load_body(goal_id)
+    return goal
+
+  def has_goal(self, goal_id):
+    return self._connect().execute("SELECT 1 FROM goals WHERE id = ?", (goal_id,)).fetchone() != None
+
+  def load_all_goals(self, use_cache=True):
+    connection = self._connect()
+    goals = {}
+    for goal_id, header in connection.execute("SELECT id, header FROM goals ORDER BY id"):
+      goal = SqliteStorage._goal_from_header(header)
+      goals[goal.id] = goal
+    #enough of each goal's last row to answer last_updated_at without reading the rest
+    last_rows = connection.execute("SELECT progress.goal_id, progress.exact FROM progress JOIN "
+      "(SELECT goal_id, MAX(row_number) AS row_number FROM progress GROUP BY goal_id) AS last "
+      "ON progress.goal_id = last.goal_id AND progress.row_number = last.row_number")
+    for goal_id, exact in last_rows:
+      if goal_id in goals:
+        goals[goal_id]._last_progress_end = decimal.Decimal(json.loads(exact)[1])
+    self.data_version = self._get_data_version()
+    reset_derived_views()
+    _loaded_bodies.clear()
+    replay_journal(goals)
+    return goals
+
+  def refresh_goals(self, goal_dict):
+    if self._get_data_version() == self.data_version and _get_journal_signature() == _journal_signature:
+      return
+    goals = self.load_all_goals()
+    goal_dict.clear()
+    goal_dict.update(goals)
+
+  def load_body(self, goal_id):
+    connection = self._connect()
+    progress = [SqliteStorage._parse_row(exact, notes) for exact, notes in
+      connection.execute("SELECT exact, notes FROM progress WHERE goal_id = ? ORDER BY row_number", (goal_id,))]
+    thoughts = connection.execute("SELECT thoughts FROM goals WHERE id = ?", (goal_id,)).fetchone()[0]
+    return progress, thoughts
+
+  def save_goal(self, goal):
+    header = goal.get_file_data()
+    del header["progress"]
+    del header["thoughts"]
+    #different for every save by anybody, unlike last_saved_at
+    goal._save_stamp = "%x.%x.%x" % (time.time_ns(), os.getpid(), next(SqliteStorage._save_counter))
+    header["_save_stamp"] = goal._save_stamp
+    rows = []
+    for row_number, row in enumerate(goal.progress):
+      start, end, focus, notes = row
+      rows.append((goal.id, row_number, _to_microseconds(start), _to_microseconds(end), float(focus), notes,
+        json.dumps([str(start), str(end), str(focus)])))
+    connection = self._connect()
+    with connection:
+      connection.execute("INSERT OR REPLACE INTO goals (id, header, thoughts) VALUES (?, ?, ?)",
+        (goal.id, json.dumps(header, default=_serializer, sort_keys=True), goal.thoughts))
+      connection.execute("DELETE FROM progress WHERE goal_id = ?", (goal.id,))
+      connection.executemany("INSERT INTO progress (goal_id, row_number, start_time, end_time, focus, notes, exact) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+  def open_for_edit(self, goal):
+    #the same text as a goal file, somewhere the JSON storage would never pick it up
+    file_descriptor, file_name = tempfile.mkstemp(prefix="goal-%s-" % goal.id, suffix=".json")
+    out_file = os.fdopen(file_descriptor, "w")
+    out_file.write(goal.get_file_text())
+    out_file.close()
+    return file_name
+
+  def finish_edit(self, file_name):
+    in_file = open(file_name, "r")
+    goal = Goal.load_from_text(in_file.read())
+    in_file.close()
+    self.save_goal(goal)
+    os.remove(file_name)
+    return goal
+
+  def _get_rows(self, goals, query, parameters):
+    goal_dict = dict((goal.id, goal) for goal in goals)
+    goal_order = dict((goal.id, i) for i, goal in enumerate(goals))
+    rows = []
+    for goal_id, row_number, exact, notes in self._connect().execute(query, parameters):
+      if goal_id in goal_dict:
+        rows.append((SqliteStorage._parse_row(exact, notes), goal_dict[goal_id], goal_order[goal_id], row_number))
+    #the same order as the interval index, which is the order the reports have always printed in
+    rows.sort(key=lambda row: (row[0][0], row[2], row[3]))
+    return [(row, goal) for row, goal, order, row_number in rows]
+
+  def iter_rows_after(self, goals, start_time, reverse=False):
+    if self._has_unsaved_progress():
+      return GoalStorage.iter_rows_after(self, goals, start_time, reverse)
+    rows = self.get_rows_after(goals, start_time)
+    if reverse:
+      rows.reverse()
+    return iter(rows)
+
+  def get_rows_after(self, goals, start_time):
+    if self._has_unsaved_progress():
+      return GoalStorage.get_rows_after(self, goals, start_time)
+    #microseconds are only used to narrow things down, the exact comparison is done on the decimals
+    rows = self._get_rows(goals, "SELECT goal_id, row_number, exact, notes FROM progress WHERE start_time >= ?",
+      (_to_microseconds(start_time),))
+    return [(row, goal) for row, goal in rows if row[0] > start_time]
+
+  def get_rows_in_period(self, goals, start_time, end_time):
+    if self._has_unsaved_progress():
+      return GoalStorage.get_rows_in_period(self, goals, start_time, end_time)
+    rows = self._get_rows(goals, "SELECT goal_id, row_number, exact, notes FROM progress "
+      "WHERE start_time >= ? AND start_time <= ? AND end_time <= ?",
+      (_to_microseconds(start_time) - 1, _to_microseconds(end_time) + 1, _to_microseconds(end_time) + 1))
+    return [(row, goal) for row, goal in rows if row[0] >= start_time and row[0] <= end_time and row[1] <= end_time]
+
+  def iter_rows_in_period(self, goals, start_time, end_time):
+    if self._has_unsaved_progress():
+      return GoalStorage.iter_rows_in_period(self, goals, start_time, end_time)
+    return self._iter_rows_in_period(goals, start_time, end_time)
+
+  def _iter_rows_in_period(self, goals, start_time, end_time):
+    goal_dict = dict((goal.id, goal) for goal in goals)
+    #sqlite hands the rows over as the cursor moves, so only one is ever held.  Ties on start are in goal id order
+    #rather than goal order, which only matters for goals logged at exactly the same time
+    cursor = self._connect().execute("SELECT goal_id, exact, notes FROM progress "
+      "WHERE start_time >= ? AND start_time <= ? AND end_time <= ? ORDER BY start_time, goal_id, row_number",
+      (_to_microseconds(start_time) - 1, _to_microseconds(end_time) + 1, _to_microseconds(end_time) + 1))
+    for goal_id, exact, notes in cursor:
+      if goal_id in goal_dict:
+        row = SqliteStorage._parse_row(exact, notes)
+        if row[0] >= start_time and row[0] <= end_time and row[1] <= end_time:
+          yield row, goal_dict[goal_id]
+
+  def get_durations_by_goal(self, goals, start_time, end_time):
+    if self._has_unsaved_progress():
+      return GoalStorage.get_durations_by_goal(self, goals, start_time, end_time)
+    goal_dict = dict((goal.id, goal) for goal in goals)
+    goal_durations = {}
+    totals = self._connect().execute("SELECT goal_id, SUM(end_time - start_time) FROM progress "
+      "WHERE start_time >= ? AND end_time <= ? GROUP BY goal_id",
+      (_to_microseconds(start_time), _to_microseconds(end_time)))
+    for goal_id, total in totals:
+      if goal_id in goal_dict:
+        goal_durations[goal_dict[goal_id]] = _from_microseconds(total)
+    return goal_durations
+
+STORAGE_TYPES = {"json": JsonDirectoryStorage, "sqlite": SqliteStorage}
+_storages = {}
+
+def get_storage(name=None):
+  """The storage called name, or the one that STORAGE says goals are kept in"""
+  if name == None:
+    name = STORAGE
+  if name not in _storages:
+    _storages[name] = STORAGE_TYPES[name]()
+  return _storages[name]
+
+def load_all_goals(use_cache=True):
+  """{id: goal} for every goal in storage"""
+  return get_storage().load_all_goals(use_cache)
+
+def refresh_goals(goal_dict):
+  """Bring an already loaded goal_dict up to date with whatever other processes stored"""
+  get_storage().refresh_goals(goal_dict)
+
+ARCHIVE_DIRECTORY = "goals/archive"
+ARCHIVE_INDEX_FILE = ARCHIVE_DIRECTORY + "/index.json"
+#completed goals that nobody has touched for this many days are moved into the archive by --archive
+ARCHIVE_AFTER_DAYS = 90
+try:
+  import lzma
+  _compress, _decompress, ARCHIVE_EXTENSION = lzma.compress, lzma.decompress, ".xz"
+except ImportError:
+  #python built without liblzma
+  import zlib
+  _compress, _decompress, ARCHIVE_EXTENSION = zlib.compress, zlib.decompress, ".z"
+
+class GoalArchive():
+  """
+  Completed goals that have been moved out of goals/, so that loading doesn't have to read them.  They are kept in
+  compressed segments, one per month of their last update, with a small uncompressed index of what is where.
+  A segment is only read once a query reaches back into its goals, and a goal that gets time again is written back
+  to goals/ like any other goal, at which point its file wins over its archived copy.
+  """
+  def __init__(self):
+    #{goal id: {"segment": "YYYY-MM", "description": ..., "last": last_updated_at}}
+    self.goals = {}
+    #archived goals read so far, by id
+    self.loaded = {}
+    self.loaded_segments = set()
+
+  @staticmethod
+  def load():
+    """The archive in ARCHIVE_DIRECTORY, or None if nothing was ever archived"""
+    if not os.path.exists(ARCHIVE_INDEX_FILE):
+      return None
+    in_file = open(ARCHIVE_INDEX_FILE, "r")
+    data = json.loads(in_file.read())
+    in_file.close()
+    archive = GoalArchive()
+    for goal_id, entry in data["goals"].items():
+      entry["last"] = decimal.Decimal(entry["last"])
+      archive.goals[int(goal_id)] = entry
+    return archive
+
+  def save(self):
+    os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+    _replace_file(ARCHIVE_INDEX_FILE, json.dumps({"goals": self.goals}, default=_serializer, sort_keys=True))
+
+  @staticmethod
+  def get_segment_file_name(segment):
+    return ARCHIVE_DIRECTORY + "/" + segment + ARCHIVE_EXTENSION
+
+  def read_segment(self, segment):
+    """{goal id: goal file text} for every goal in segment"""
+    file_name = GoalArchive.get_segment_file_name(segment)
+    if not os.path.exists(file_name):
+      return {}
+    in_file = open(file_name, "rb")
+    data = json.loads(_decompress(in_file.read()).decode("utf-8"))
+    in_file.close()
+    return dict((int(goal_id), text) for goal_id, text in data.items())
+
+  def write_segment(self, segment, texts):
+    os.makedirs(ARCHIVE_DIRECTORY, exist_ok=True)
+    data = json.dumps(dict((str(goal_id), text) for goal_id, text in texts.items()), sort_keys=True)
+    _replace_file(GoalArchive.get_segment_file_name(segment), _compress(data.encode("utf-8")))
+
+  def get_archived_ids(self, hot_ids=()):
+    """Ids of archived goals, leaving out any that are back in goals/"""
+    return set(self.goals.keys()).difference(hot_ids)
+
+  def load_goals(self, goal_ids):
+    """Read the segments that goal_ids are in.  Returns whether any had to be read"""
+    segments = set(self.goals[goal_id]["segment"] for goal_id in goal_ids).difference(self.loaded_segments)
+    for segment in sorted(segments):
+      for goal_id, text in self.read_segment(segment).items():
+        #a goal that was archived again since has its latest copy in another segment
+        if goal_id in self.goals and self.goals[goal_id]["segment"] == segment:
+          self.loaded[goal_id] = Goal.load_from_text(text)
+      self.loaded_segments.add(segment)
+    return len(segments) > 0
+
+  def find(self, text):
+    """Ids of archived goals whose title contains text"""
+    return [goal_id for goal_id, entry in self.goals.items() if text in entry["description"].split('.')[0].lower()]
+
+  def add(self, goals):
+    """Move goals into their segments.  Their files are left for the caller to remove once this returns"""
+    by_segment = {}
+    for goal in goals:
+      segment = _get_local_day(goal.last_updated_at).strftime("%Y-%m")
+      by_segment.setdefault(segment, []).append(goal)
+    for segment, segment_goals in sorted(by_segment.items()):
+      texts = self.read_segment(segment)
+      for goal in segment_goals:
+        texts[goal.id] = goal.get_file_text()
+      self.write_segment(segment, texts)
+      for goal in segment_goals:
+        self.goals[goal.id] = {"segment": segment, "description": goal.description, "last": goal.last_updated_at}
+    self.save()
+
+_archive = None
+_archive_loaded = False
+
+def get_archive():
+  """The goal archive, or None if there isn't one.  Only goals kept in goal files are ever archived"""
+  global _archive, _archive_loaded
+  if not isinstance(get_storage(), JsonDirectoryStorage):
+    return None
+  if not _archive_loaded:
+    _archive = GoalArchive.load()
+    _archive_loaded = True
+  return _archive
+
+def forget_archive():
+  """Read the archive index again next time, after another process may have changed it"""
+  global _archive, _archive_loaded
+  _archive = None
+  _archive_loaded = False
+
+def _get_archived_ids(goals):
+  """Ids of archived goals that are not among goals, which derived views must not mistake for deleted ones"""
+  archive = get_archive()
+  if archive == None:
+    return set()
+  return archive.get_archived_ids(goal.id for goal in goals)
+
+def reach_into_archive(goals, start_time):
+  """
+  goals, along with every archived goal that has progress after start_time and every one that was read before.
+  Segments are read the first time a query reaches back far enough to need them, and everything derived from the
+  goals is rebuilt to take them in.
+  """
+  archive = get_archive()
+  if archive == None:
+    return goals
+  hot_ids = set(goal.id for goal in goals)
+  needed = [goal_id for goal_id in archive.get_archived_ids(hot_ids) if archive.goals[goal_id]["last"] > start_time]
+  if archive.load_goals(needed):
+    reset_derived_views()
+  archived_goals = [goal for goal_id, goal in sorted(archive.loaded.items()) if goal_id not in hot_ids]
+  if len(archived_goals) <= 0:
+    return goals
+  return list(goals) + archived_goals
+
+def find_archived_goals(text, goal_dict):
+  """Archived goals whose title contains text, or whose id is text, added to goal_dict so that they can get time"""
+  archive = get_archive()
+  if archive == None:
+    return []
+  archived_ids = archive.get_archived_ids(goal_dict.keys())
+  if isinstance(text, int):
+    found_ids = [text] if text in archived_ids else []
+  else:
+    found_ids = [goal_id for goal_id in archive.find(text) if goal_id in archived_ids]
+  archive.load_goals(found_ids)
+  found_goals = [archive.loaded[goal_id] for goal_id in found_ids]
+  found_goals.sort(key=lambda goal: (goal.is_complete, -goal.last_updated_at, goal.id))
+  for goal in found_goals:
+    goal_dict[goal.id] = goal
+    _notify_goal_added(goal)
+  return found_goals
+
+def archive_goals(days=None):
+  """Move goals that were completed and untouched for days (ARCHIVE_AFTER_DAYS by default) into the archive"""
+  if days == None:
+    days = ARCHIVE_AFTER_DAYS
+  if not isinstance(get_storage(), JsonDirectoryStorage):
+    print("Only goals kept in goal files can be archived")
+    return
+  cutoff = NOW - days * one_day_in_seconds
+  with FileLock(LOCK_DIRECTORY + "/archive.lock"):
+    goal_dict = load_all_goals()
+    forget_archive()
+    archive = get_archive() or GoalArchive()
+    #journaled progress isn't in the goal file yet, so those wait until the journal is compacted
+    goals = [goal for goal in goal_dict.values() if goal.is_complete and goal.completed_at <= cutoff
+      and goal.last_updated_at <= cutoff and goal.id not in _journal_goals]
+    goals.sort(key=lambda goal: goal.id)
+    if len(goals) > 0:
+      archive.add(goals)
+    #the archived copies are written, so a crash from here on only leaves goals that are in both places
+    for goal in goals:
+      with get_storage().lock_goal(goal.id):
+        os.remove(Goal.file_name_from_id(goal.id))
+  print("Archived %s goals, %s are left in goals/" % (len(goals), len(goal_dict) - len(goals)))
+  forget_archive()
+
+def migrate_storage(source_name, target_name):
+  """
+  Copy every goal, with its progress and thoughts, and the next id from one storage to the other, then read them
+  all back from the target and check that each one comes out exactly as it went in
+  """
+  global STORAGE
+  for name in (source_name, target_name):
+    if name not in STORAGE_TYPES:
+      print("Unknown storage %s, expected one of %s" % (name, ", ".join(sorted(STORAGE_TYPES.keys()))))
+      return
+  if source_name == target_name:
+    print("Nothing to do, %s is already where goals are" % source_name)
+    return
+  current_storage = STORAGE
+  try:
+    STORAGE = source_name
+    source_goals = load_all_goals(use_cache=False)
+    #archived goals go along too, no other storage has an archive
+    source_goals = dict((goal.id, goal) for goal in reach_into_archive(list(source_goals.values()), decimal.Decimal("-Infinity")))
+    target = get_storage(target_name)
+    goal_texts = {}
+    for goal in source_goals.values():
+      #bodies come from the source while STORAGE still points at it
+      goal_texts[goal.id] = goal.get_file_text()
+      target.save_goal(goal)
+    target.set_next_id(get_storage(source_name).get_next_id())
+    STORAGE = target_name
+    target_goals = load_all_goals(use_cache=False)
+    mismatched = [goal_id for goal_id in goal_texts if goal_id not in target_goals or target_goals[goal_id].get_file_text() != goal_texts[goal_id]]
+    extra = [goal_id for goal_id in target_goals if goal_id not in goal_texts]
+  finally:
+    STORAGE = current_storage
+  print("Copied %s goals from %s to %s" % (len(goal_texts), source_name, target_name))
+  if len(mismatched) > 0:
+    print("These goals did not come back the same: %s" % ", ".join(str(goal_id) for goal_id in sorted(mismatched)))
+  if len(extra) > 0:
+    print("These goals were already in %s and are not in %s: %s" % (target_name, source_name, ", ".join(str(goal_id) for goal_id in sorted(extra))))
+  if len(mismatched) <= 0:
+    print("Set STORAGE = \"%s\" to use it" % target_name)
+
+def migrate_goal_format():
+  """
+  Rewrite every goal stored in an older shape than GOAL_FORMAT_VERSION, so that loading it takes the fast path.
+  Archived goals are read rarely enough to be left as they are.
+  """
+  storage = get_storage()
+  goal_dict = load_all_goals(use_cache=False)
+  migrated = 0
+  for goal in goal_dict.values():
+    if goal.format_version >= GOAL_FORMAT_VERSION:
+      continue
+    with storage.lock_goal(goal.id):
+      if storage.has_changed(goal):
+        goal = storage.reload_goal(goal.id)
+      #save_goal rather than save, the goal itself is no different and last_saved_at shouldn't say it is
+      storage.save_goal(goal)
+    goal.format_version = GOAL_FORMAT_VERSION
+    migrated += 1
+  print("Rewrote %s of %s goals in format %s" % (migrated, len(goal_dict), GOAL_FORMAT_VERSION))
+
+class TitleIndex():
+  """
+  N-gram index over goal titles, so that finding the goals whose title contains some text only looks at goals that
+  share its n-grams instead of scanning every title.
+  """
+  NGRAM = 3
+
+  def __init__(self, goals, state=None, changed_ids=()):
+    """goals is the whole goal dict.  state is from get_state, and changed_ids are goals that differ from it"""
+    self.goals = goals
+    if state == None:
+      self.titles = {}
+      self.grams = {}
+      for goal in goals.values():
+        self.add(goal)
+      return
+    self.titles = state["titles"]
+    self.grams = state["grams"]
+    for goal_id in changed_ids:
+      self.remove(goal_id)
+      if goal_id in goals:
+        self.add(goals[goal_id])
+
+  def get_state(self):
+    return {"titles": self.titles, "grams": self.grams}
+
+  def _get_grams(self, title):
+    grams = set()
+    for length in range(1, TitleIndex.NGRAM+1):
+      for i in range(0, len(title)-length+1):
+        grams.add(title[i:i+length])
+    return grams
+
+  def add(self, goal):
+    title = goal.title
+    self.titles[goal.id] = title
+    for gram in self._get_grams(title):
+      if gram not in self.grams:
+        self.grams[gram] = set()
+      self.grams[gram].add(goal.id)
+
+  def remove(self, goal_id):
+    title = self.titles.pop(goal_id, None)
+    if title == None:
+      return
+    for gram in self._get_grams(title):
+      self.grams[gram].discard(goal_id)
+      if len(self.grams[gram]) <= 0:
+        del self.grams[gram]
+
+  def update(self, goal):
+    if self.titles.get(goal.id) != goal.title:
+      self.remove(goal.id)
+      self.add(goal)
+
+  def find(self, text):
+    """Goals whose title contains text, incomplete and recently used goals first"""
+    if len(text) <= TitleIndex.NGRAM:
+      if text:
+        goal_ids = self.grams.get(text, ())
+      else:
+        goal_ids = self.titles.keys()
+    else:
+      postings = [self.grams.get(text[i:i+TitleIndex.NGRAM], set()) for i in range(0, len(text)-TitleIndex.NGRAM+1)]
+      postings.sort(key=len)
+      #sharing every n-gram is necessary but not sufficient
+      goal_ids = [goal_id for goal_id in postings[0].intersection(*postings[1:]) if text in self.titles[goal_id]]
+    found_goals = [self.goals[goal_id] for goal_id in goal_ids if goal_id in self.goals]
+    found_goals.sort(key=lambda goal: (goal.is_complete, -goal.last_updated_at, goal.id))
+    return found_goals
+
+_title_index = None
+
+def get_title_index(goals):
+  """The title index over goals, which must be the whole loaded goal dict"""
+  global _title_index
+  if _title_index == None:
+    _title_index = TitleIndex(goals)
+  return _title_index
+
 def parse_goal_from_user(user_data, goals):
   user_data = user_data.strip()
   #first try to find by goal id
   try:
     user_data =  int(user_data)
+    if user_data not in goals:
+      find_archived_goals(user_data, goals)
     return goals[user_data]
   #then look for goal name
   except ValueError:
     user_data = user_data.lower()
-    possible_goals = [goal for goal in goals.values() if user_data in goal.title]
+    possible_goals = get_title_index(goals).find(user_data)
+    if len(possible_goals) <= 0:
+      #nothing in goals/ matches, but something long finished might
+      possible_goals = find_archived_goals(user_data, goals)
     exact_goals = [goal for goal in possible_goals if goal.title == user_data]
     if len(exact_goals) == 1:
       return exact_goals[0]
@@ -144,32 +1322,97 @@ def parse_goal_from_user(user_data, goals):
       return possible_goals[0]
     assert len(possible_goals) > 0, "Could not find any goals with that text."
     #hmm, user was ambiguous.  Ask them to clarify:
-    goal_choice = prompt("\n".join([str(i)+". "+possible_goals[i] for i in range(0,len(possible_goals))]))
+    goal_choice = prompt("\n".join([str(i)+". "+possible_goals[i].title for i in range(0,len(possible_goals))]))
     return possible_goals[int(goal_choice.strip())]
 
+class EffortSums():
+  """
+  A goal's rows ordered by end time along with the running total of their focus weighted effort, so that the effort
+  inside any window takes a couple of bisects and a subtraction instead of a walk over the goal's whole history
+  """
+  def __init__(self, progress):
+    self.ends = []
+    self.starts = []
+    self.focuses = []
+    #totals[i] is the effort of the first i rows, in end order
+    self.totals = [decimal.Decimal(0)]
+    #no row is longer than this, which bounds how many rows can straddle either edge of a window
+    self.longest = decimal.Decimal(0)
+    #how many rows of progress are in here
+    self.row_count = 0
+    self.extend(progress)
+
+  def extend(self, progress):
+    """Add the rows that were appended to progress since the last time"""
+    for row in progress[self.row_count:]:
+      self.add_row(row)
+
+  def add_row(self, row):
+    start, end, focus = row[0], row[1], row[2]
+    position = bisect.bisect_right(self.ends, end)
+    self.ends.insert(position, end)
+    self.starts.insert(position, start)
+    self.focuses.insert(position, focus)
+    self.totals.insert(position+1, None)
+    #only ever more than one pass when a row was logged out of order
+    for i in range(position, len(self.ends)):
+      self.totals[i+1] = self.totals[i] + max(self.ends[i] - self.starts[i], 0) * self.focuses[i]
+    self.longest = max(self.longest, end - start)
+    self.row_count += 1
+
+  def get_effort(self, start_time, end_time):
+    """Focus weighted time inside start_time to end_time, counting only the part of each row that is in there"""
+    if end_time <= start_time:
+      return decimal.Decimal(0)
+    first = bisect.bisect_right(self.ends, start_time)
+    last = bisect.bisect_right(self.ends, end_time)
+    effort = self.totals[last] - self.totals[first]
+    #rows that end inside the window but started before it
+    i = first
+    while i < last and self.ends[i] < start_time + self.longest:
+      if self.starts[i] < start_time:
+        effort -= (start_time - self.starts[i]) * self.focuses[i]
+      i += 1
+    #rows that started before the end of the window but end after it
+    i = last
+    while i < len(self.ends) and self.ends[i] < end_time + self.longest:
+      if self.starts[i] < end_time:
+        effort += (end_time - max(self.starts[i], start_time)) * self.focuses[i]
+      i += 1
+    return effort
+
+#progress signatures add up row hashes modulo this
+SIGNATURE_MODULUS = 2**64
+
+def _get_row_hash(row_number, row):
+  #hashes of numbers, unlike those of strings, are the same in every process.  Notes don't go into anything derived
+  return hash((row_number, row[0], row[1], row[2])) % SIGNATURE_MODULUS
+
+def _get_progress_signature(progress):
+  """(row count, sum of row hashes), see Goal.get_progress_signature"""
+  total = 0
+  for row_number, row in enumerate(progress):
+    total += _get_row_hash(row_number, row)
+  return (len(progress), total % SIGNATURE_MODULUS)
+
 class Goal:
   ID_FILE = "goals/next.id"
   THOUGHT_SEPARATOR = "*********************************"
 
   @staticmethod
   def get_next_id():
-    inFile = open(Goal.ID_FILE, "r")
-    nextId = int(inFile.read().strip())
-    inFile.close()
-    return nextId
+    return get_storage().get_next_id()
   
   @staticmethod  
-  def increment_next_id():
-    nextId = Goal.get_next_id()
-    nextId += 1
-    outFile = open(Goal.ID_FILE, "w")
-    outFile.write(str(nextId))
-    outFile.close()
+  def allocate_id():
+    """Take the next id, which no other process will get even if it asks at the same moment"""
+    return get_storage().allocate_id()
   
   def __init__(self):
     self.id = None
     self.description = ""
-    self.thoughts = ""
+    #progress and thoughts are None when they have not been read from the file yet, see LAZY_LOADING
+    self._thoughts = ""
     self.tags = []
     self.value_components = {}
     self.cost_components = {}
@@ -177,8 +1420,51 @@ class Goal:
     self.completed_at = None
     self.created_at = None
     self.last_saved_at = None
-    self.progress = []
+    self._progress = []
+    #end of the last progress row, kept for when progress is not loaded
+    self._last_progress_end = None
     self.requires = []
+    #GOAL_FORMAT_VERSION of the file this goal was loaded from
+    self.format_version = GOAL_FORMAT_VERSION
+    #sequence number of the last journal record applied to this goal in memory, see JOURNAL_MARKS_FILE
+    self._journal_seq = 0
+    #what the database stamped the goal with when we last loaded or saved it, see SqliteStorage.has_changed
+    self._save_stamp = None
+    #EffortSums over progress, built the first time somebody asks for effort
+    self._effort_sums = None
+    #(row count, row numbers by start time or None if progress is already in that order), see get_start_order
+    self._start_order = None
+    #(row count, sum of row hashes) once somebody asks, kept up to date as rows come and go, see get_progress_signature
+    self._progress_signature = None
+    #False for goals that were read without their rows, which go by their header instead
+    self._rows_signed = True
+
+  @property
+  def progress(self):
+    if self._progress == None:
+      self._load_body()
+    if LAZY_LOADING:
+      _touch_loaded_body(self)
+    return self._progress
+
+  @progress.setter
+  def progress(self, value):
+    self._progress = value
+    self._effort_sums = None
+    self._start_order = None
+    self._progress_signature = None
+
+  @property
+  def thoughts(self):
+    if self._thoughts == None:
+      self._load_body()
+    if LAZY_LOADING:
+      _touch_loaded_body(self)
+    return self._thoughts
+
+  @thoughts.setter
+  def thoughts(self, value):
+    self._thoughts = value
     
   @staticmethod
   def file_name_from_id(file_id):
@@ -187,10 +1473,28 @@ class Goal:
   @staticmethod
   def load_from_file(file_name):
     #file_name = Goal.file_name_from_id(file_id)
+    goal = Goal.read_file(file_name)
+    if LAZY_LOADING:
+      goal._unload_body()
+    return goal
+
+  @staticmethod
+  def read_file(file_name):
+    """The whole goal in file_name, progress and all"""
     in_file = open(file_name, "r")
     data = in_file.read()
     in_file.close()
+    try:
+      return Goal.load_from_text(data)
+    except Exception as error:
+      raise ValueError("Could not load %s: %s" % (file_name, error)) from error
+
+  @staticmethod
+  def load_from_text(data):
+    """A goal from the contents of a goal file"""
     goal = Goal()
+    #files from before there was a version
+    goal.format_version = 1
     thoughts, jsonData = data.split(Goal.THOUGHT_SEPARATOR)
     obj = json.loads(jsonData)
     #copy all the keys from obj to us
@@ -199,11 +1503,54 @@ class Goal:
     goal.thoughts = thoughts.strip()
     goal._finish_load()
     return goal
+
+  def _load_body(self):
+    """Read progress and thoughts back in from storage, for a goal that was loaded lazily"""
+    self._progress, self._thoughts = get_storage().load_body(self.id)
+    self._effort_sums = None
+    self._start_order = None
+
+  def _unload_body(self):
+    if self._progress != None and self._rows_signed:
+      #so that it doesn't take reading the file again
+      self.get_progress_signature()
+    if self._progress != None and len(self._progress) > 0:
+      self._last_progress_end = self._progress[-1][1]
+    elif self._progress != None:
+      self._last_progress_end = None
+    self._progress = None
+    self._thoughts = None
+    self._effort_sums = None
+    self._start_order = None
+
+  def get_snapshot_state(self):
+    """What the snapshot keeps for this goal, which is only the header when loading lazily"""
+    if self._progress != None and self._rows_signed:
+      self.get_progress_signature()
+    state = dict(self.__dict__)
+    state["_effort_sums"] = None
+    state["_start_order"] = None
+    if LAZY_LOADING:
+      if self._progress != None and len(self._progress) > 0:
+        state["_last_progress_end"] = self._progress[-1][1]
+      state["_progress"] = None
+      state["_thoughts"] = None
+    return state
+
+  def get_file_data(self):
+    """Everything that goes into the JSON part of the file"""
+    data = dict((key, value) for key, value in self.__dict__.items() if not key.startswith("_"))
+    data["progress"] = self.progress
+    #whatever the goal was loaded from, it is written in the current shape
+    data["format_version"] = GOAL_FORMAT_VERSION
+    #thoughts are written above the JSON as plain text
+    data["thoughts"] = ""
+    return data
     
   def load_from_user(self, tags):
     self.created_at = NOW
     #get the next highest id automatically
-    self.id = Goal.get_next_id()
+    self.id = Goal.allocate_id()
     #assign tags automatically from the interface
     self.tags = tags
     #read a description
@@ -232,32 +1579,72 @@ class Goal:
     self._finish_load()
     #save the goal
     self.save()
-    Goal.increment_next_id()
     
   def save(self):
-    """Serialize mostly to JSON.  Have to handle Decimals specially, and the thoughts field, which I want to be directly editable text"""
+    with get_storage().lock_goal(self.id):
+      self._write()
+
+  def _write(self):
+    #only with the goal's lock held
     self.last_saved_at = NOW
-    thoughts = self.thoughts
-    self.thoughts = ""
-    data = thoughts+"\n"+Goal.THOUGHT_SEPARATOR+"\n"+json.dumps(self.__dict__, default=_serializer, sort_keys=True, indent=2)
-    self.thoughts = thoughts
-    outFile = open(Goal.file_name_from_id(self.id), 'w')
-    outFile.write(data)
-    outFile.close()
+    get_storage().save_goal(self)
+
+  @contextlib.contextmanager
+  def _updating(self):
+    """
+    Around a change to progress that is saved straight away.  Holds the goal's lock, and first picks up whatever
+    another process saved for this goal since we loaded it, so that neither of the two changes is lost.
+    """
+    if USE_PROGRESS_JOURNAL and _deferred_saves == None:
+      #only the journal is written, and whatever is in the goal file gets merged with it when it is compacted
+      yield
+      return
+    if _deferred_saves != None:
+      #nothing is written to the goal yet, see _save_deferred for how it gets merged with what is there by then
+      if self.id not in _deferred_rows:
+        _deferred_rows[self.id] = [len(self.progress), len(self.progress), self.completed_at]
+      yield
+      _deferred_rows[self.id][1] = min(_deferred_rows[self.id][1], len(self.progress))
+      return
+    storage = get_storage()
+    with storage.lock_goal(self.id):
+      if storage.has_changed(self):
+        self.__dict__.update(storage.reload_goal(self.id).__dict__)
+        #the views were built from what we had before
+        reset_derived_views()
+      yield
+
+  def _save_deferred(self, loaded_count, kept_count, completed_at):
+    """
+    Save changes that were held back since the goal had loaded_count rows, on top of whatever another process saved
+    for it since.  Rows past kept_count are ours, the ones between that and loaded_count were undone by us.
+    """
+    storage = get_storage()
+    with storage.lock_goal(self.id):
+      if storage.has_changed(self):
+        stored = storage.reload_goal(self.id)
+        stored.progress = stored.progress[:kept_count] + stored.progress[loaded_count:] + self.progress[kept_count:]
+        if self.completed_at != completed_at:
+          stored.completed_at = self.completed_at
+        self.__dict__.update(stored.__dict__)
+        #the views were built from what we had before
+        reset_derived_views()
+      self._write()
+
+  def get_file_text(self):
+    """Serialize mostly to JSON.  Have to handle Decimals specially, and the thoughts field, which I want to be directly editable text"""
+    return self.thoughts+"\n"+Goal.THOUGHT_SEPARATOR+"\n"+json.dumps(self.get_file_data(), default=_serializer, sort_keys=True, indent=2)
     
   def _finish_load(self):
-    _convert_values_to_decimal(self.value_components)
-    _convert_values_to_decimal(self.cost_components)
-    _convert_values_to_decimal(self.time_components)
-    real_progress = []
-    for data in self.progress:
-      if len(data) == 2:
-        data.append(1)
-      if len(data) == 3:
-        data.append("")
-      start, end, focus, notes = data
-      real_progress.append([decimal.Decimal(start), decimal.Decimal(end), decimal.Decimal(focus), notes])
-    self.progress = real_progress
+    _convert_values_to_decimal(self.value_components, self.format_version)
+    _convert_values_to_decimal(self.cost_components, self.format_version)
+    _convert_values_to_decimal(self.time_components, self.format_version)
+    #storage that keeps progress apart hands over just the header
+    if self._progress != None:
+      self.progress = _convert_progress(self._progress, self.format_version)
+    #files from before the journal kept its marks to itself
+    if "journal_seq" in self.__dict__:
+      self._journal_seq = self.__dict__.pop("journal_seq")
     self.created_at = decimal.Decimal(self.created_at)
     if self.last_saved_at:
       self.last_saved_at = decimal.Decimal(self.last_saved_at)
@@ -265,41 +1652,107 @@ class Goal:
       self.completed_at = decimal.Decimal(self.completed_at)
     
   def add_time(self, start_time, end_time, focus, notes, is_complete):
-    #put a new entry into progress
-    self.progress.append([start_time, end_time, focus, notes])
-    if is_complete:
-      self.completed_at = NOW
-    ##put a new entry into our log
-    # log = ActivityLog.load()
-    # log.add([self.id, start_time, end_time])
-    self.save()
+    with self._updating():
+      #what the views have to have seen of the goal for the new row to be all they are missing
+      was = self.get_progress_signature()
+      #put a new entry into progress
+      self.progress.append([start_time, end_time, focus, notes])
+      self._sign_row(len(self.progress)-1, 1)
+      if is_complete:
+        self.completed_at = NOW
+      ##put a new entry into our log
+      # log = ActivityLog.load()
+      # log.add([self.id, start_time, end_time])
+      _notify_row_added(self, self.progress[-1], was)
+      if _deferred_saves != None:
+        _deferred_saves[self.id] = self
+      elif USE_PROGRESS_JOURNAL:
+        record = {"op": "add", "row": self.progress[-1]}
+        if is_complete:
+          record["completed_at"] = self.completed_at
+        append_journal_record(self, record)
+      else:
+        self._write()
     
   def undo_add_time(self):
-    #this happens when the user inputs an incorrect value
-    #pop the last entry off our time stack.  
-    self.progress.pop()
-    ##also update the activity log
-    # log = ActivityLog.load()
-    # log.pop()
-    self.save()
+    with self._updating():
+      #this happens when the user inputs an incorrect value
+      was = self.get_progress_signature()
+      #pop the last entry off our time stack.  
+      row = self.progress.pop()
+      self._effort_sums = None
+      self._start_order = None
+      self._sign_row(len(self.progress), -1, row)
+      _notify_row_removed(self, row, len(self.progress), was)
+      ##also update the activity log
+      # log = ActivityLog.load()
+      # log.pop()
+      if _deferred_saves != None:
+        _deferred_saves[self.id] = self
+      elif USE_PROGRESS_JOURNAL:
+        append_journal_record(self, {"op": "undo"})
+      else:
+        self._write()
     
   def get_effort_in_interval(self, start_time, end_time):
-    total_effort = decimal.Decimal(0)
-    for start, end, focus, notes in self.progress:
-      if end < start_time:
-        end = start_time
-      effort = end - start
-      if effort < 0:
-        continue
-      total_effort += effort * focus
-    return total_effort
+    """Focus weighted time spent on this goal between start_time and end_time"""
+    progress = self.progress
+    if self._effort_sums == None or self._effort_sums.row_count > len(progress):
+      self._effort_sums = EffortSums(progress)
+    else:
+      self._effort_sums.extend(progress)
+    return self._effort_sums.get_effort(start_time, end_time)
     
+  def _sign_row(self, row_number, sign, row=None):
+    """Add row_number to the progress signature, or take it out again if sign is -1, row being what it was"""
+    if self._progress_signature == None:
+      #it is worked out from all of the rows when it is first asked for
+      return
+    if row == None:
+      row = self.progress[row_number]
+    count, total = self._progress_signature
+    self._progress_signature = (count + sign, (total + sign * _get_row_hash(row_number, row)) % SIGNATURE_MODULUS)
+
+  def get_progress_signature(self):
+    """
+    A string that changes whenever a row is added, removed or edited, even by hand in the file, so that the files
+    derived from progress can tell which goals they are stale for
+    """
+    if not self._rows_signed:
+      #only the header was read, from storage that nothing but us writes to, and our saves always move these
+      return "saved %s %s" % (self.last_saved_at, self.last_updated_at)
+    if self._progress_signature == None:
+      self._progress_signature = _get_progress_signature(self.progress)
+    return "%s:%x" % self._progress_signature
+
+  def get_start_order(self):
+    """Row numbers of progress sorted by start time, or None when progress is already in that order, as it usually is"""
+    progress = self.progress
+    if self._start_order == None or self._start_order[0] > len(progress):
+      self._start_order = (0, None)
+    row_count, order = self._start_order
+    if order == None:
+      #only rows added since the last time need checking
+      for row_number in range(max(row_count, 1), len(progress)):
+        if progress[row_number][0] < progress[row_number-1][0]:
+          order = sorted(range(0, len(progress)), key=lambda row_number: progress[row_number][0])
+          break
+    elif row_count < len(progress):
+      order = sorted(range(0, len(progress)), key=lambda row_number: progress[row_number][0])
+    self._start_order = (len(progress), order)
+    return order
+
   @property
   def last_updated_at(self):
-    if len(self.progress) <= 0:
+    if self._progress == None:
+      #dont load the whole history just to find out when it ends
+      if self._last_progress_end == None:
+        return self.created_at
+      return self._last_progress_end
+    if len(self._progress) <= 0:
       return self.created_at
     else:
-      return self.progress[-1][1]
+      return self._progress[-1][1]
     
   @property
   def total_estimated_cost(self):
@@ -329,10 +1782,12 @@ class Goal:
   def is_complete(self):
     return self.completed_at != None
     
-def create_goal(user_data, tags):
+def create_goal(user_data, tags, goal_dict):
   goal = Goal()
   goal.load_from_user(tags)
   goal.save()
+  goal_dict[goal.id] = goal
+  _notify_goal_added(goal)
   
 def add_time(user_data, goal_dict, prev_entry):
   user_data = user_data.strip()
@@ -383,15 +1838,28 @@ def add_time(user_data, goal_dict, prev_entry):
     duration = parse_time_from_user(time_data, last_recorded_time)
     end_time = last_recorded_time + duration
   #update the goals
+  new_entry = None
   for goal, amount in goal_amount_pairs:
     goal.add_time(last_recorded_time, end_time, decimal.Decimal(amount), notes, is_complete)
+    entry = Entry(goal.progress[-1], goal)
+    if new_entry == None:
+      new_entry = MultiEntry(entry)
+    else:
+      new_entry.add(entry)
+  #so that the next command can carry on from where this one ended
+  return new_entry
   
 def edit(user_data, goal_dict):
   #figure out what goal the user is referring to
-  goal = parse_goal_from_user(goal_data, goal_dict)
+  goal = parse_goal_from_user(user_data, goal_dict)
   #open $EDITOR (notepad++ or emacs) with the right file
-  fileName = Goal.file_name_from_id(goal.id)
+  fileName = get_storage().open_for_edit(goal)
   os.system(fileName)
+  #pick up whatever changed, the title may well be different now
+  edited_goal = get_storage().finish_edit(fileName)
+  goal_dict[edited_goal.id] = edited_goal
+  replay_journal(goal_dict)
+  _notify_goal_replaced(goal, edited_goal)
 
 def review(goals, user_data):
   """Review everything accomplished today"""
@@ -419,14 +1887,13 @@ def simple_review(goals, user_data):
   except ValueError:
     pass
   days_ago_list = list(range(0, max_days_ago+1))
-  for days_ago in days_ago_list:
-    interesting_activities, then_date = get_interesting_activities(goals, days_ago)
-    sorted_keys = reversed(sorted(interesting_activities.keys(), key=lambda k: sum([x.duration for x in interesting_activities[k]])))
+  for activity_totals, then_date in get_interesting_activity_totals_by_day(goals, days_ago_list):
+    sorted_keys = reversed(sorted(activity_totals.keys(), key=lambda k: activity_totals[k][0]))
     print("\n%s/%s/%s\n" % (then_date.month, then_date.day, then_date.year))
     for key in sorted_keys:
-      value = interesting_activities[key]
-      total_time = int(sum([x.duration for x in value]) / decimal.Decimal(60.0))
-      print("%s (%s): %s" % (key, total_time, '. '.join([x.notes for x in value if x.notes])))
+      duration, notes = activity_totals[key]
+      total_time = int(duration / decimal.Decimal(60.0))
+      print("%s (%s): %s" % (key, total_time, '. '.join(notes)))
 
 def weekly_review(goals, user_data):
   if ' ' in user_data:
@@ -437,14 +1904,14 @@ def weekly_review(goals, user_data):
     starting_days_ago = int(user_data)
     time_span = 7
   all_activities = {}
-  for days_ago in list(range(max(0, starting_days_ago-time_span), starting_days_ago)):
-    interesting_activities, then_date = get_interesting_activities(goals, days_ago)
+  days_ago_list = list(range(max(0, starting_days_ago-time_span), starting_days_ago))
+  for activity_totals, then_date in get_interesting_activity_totals_by_day(goals, days_ago_list):
     print("\n%s/%s/%s\n" % (then_date.month, then_date.day, then_date.year))
-    for description in interesting_activities.keys():
+    for description in activity_totals.keys():
       if description not in all_activities:
         all_activities[description] = []
-      value = interesting_activities[description]
-      all_activities[description] = all_activities[description] + [(sum([x.duration for x in value]) / decimal.Decimal(3600.0), '. '.join([x.notes for x in value if x.notes]))]
+      duration, notes = activity_totals[description]
+      all_activities[description] = all_activities[description] + [(duration / decimal.Decimal(3600.0), '. '.join(notes))]
   sorted_keys = reversed(sorted(all_activities.keys(), key=lambda k: sum([x[0] for x in all_activities[k]])))
   for description in sorted_keys:
     daily_entries = all_activities[description]
@@ -454,38 +1921,115 @@ def weekly_review(goals, user_data):
       useful_notes = '\n'+useful_notes
     print('%s (%s):%s' % (description, round(total_time, 1), useful_notes))
 
+def get_review_window(days_ago):
+  """Start and end of the window that is searched for a day's activities, and the date to show for it"""
+  now_date_time = datetime.datetime.fromtimestamp(NOW)
+  time_delta = now_date_time - datetime.datetime(now_date_time.year, now_date_time.month, now_date_time.day, 0, 0, 0)
+  extra_time = 60 * 60 * 2
+  start_time = (NOW - decimal.Decimal(str(time_delta.total_seconds()))) - (days_ago * one_day_in_seconds)
+  end_time = start_time + one_day_in_seconds + extra_time
+  then_date = datetime.datetime.fromtimestamp(start_time + extra_time)
+  return start_time - extra_time, end_time, then_date
 
-def get_interesting_activities(goals, days_ago):
-    now_date_time = datetime.datetime.fromtimestamp(NOW)
-    time_delta = now_date_time - datetime.datetime(now_date_time.year, now_date_time.month, now_date_time.day, 0, 0, 0)
-    extra_time = 60 * 60 * 2
-    start_time = (NOW - decimal.Decimal(str(time_delta.total_seconds()))) - (days_ago * one_day_in_seconds)
-    recent_entries = get_multi_entries_since(goals, start_time - extra_time)
-    end_time = start_time + one_day_in_seconds + extra_time
-    interesting_activities = {}
-    found_sleep = False
-    for entry in recent_entries:
-      if entry.end_time < end_time:
-        description = entry.description
-        if 'sleep' in entry.description:
-          found_sleep = True
-          continue
-        if not found_sleep:
-          continue
-        if "upkeep" in entry.tags:
-          if description in ('make food', 'shower', 'eat', 'vacation', 'playing games'):
-            pass
-          elif description in ('travel', 'driving', 'getting ready'):
-            description = 'travel'
-          else:
-            description = 'upkeep'
-        if entry.description == 'clean':
-          description = 'upkeep'
-        if description not in interesting_activities:
-          interesting_activities[description] = []
-        interesting_activities[description].append(entry)
-    then_date = datetime.datetime.fromtimestamp(start_time + extra_time)
-    return interesting_activities, then_date
+def get_activity_description(entry):
+  """The name that an entry is reported under, lumping most upkeep together"""
+  description = entry.description
+  if "upkeep" in entry.tags:
+    if description in ('make food', 'shower', 'eat', 'vacation', 'playing games'):
+      pass
+    elif description in ('travel', 'driving', 'getting ready'):
+      description = 'travel'
+    else:
+      description = 'upkeep'
+  if entry.description == 'clean':
+    description = 'upkeep'
+  return description
+
+def _collect_interesting_activities(entries, end_time):
+  """
+  Entries by the description they are reported under, from entries in order of start time, skipping everything up
+  to the first sleep, sleep itself and anything that doesn't end before end_time
+  """
+  interesting_activities = {}
+  found_sleep = False
+  for entry in entries:
+    if entry.start_time >= end_time:
+      #so nothing from here on ends before it either
+      break
+    if entry.end_time < end_time:
+      if 'sleep' in entry.description:
+        found_sleep = True
+        continue
+      if not found_sleep:
+        continue
+      description = get_activity_description(entry)
+      if description not in interesting_activities:
+        interesting_activities[description] = []
+      interesting_activities[description].append(entry)
+  return interesting_activities
+
+def _get_activity_totals(interesting_activities):
+  activity_totals = {}
+  for description in interesting_activities.keys():
+    value = interesting_activities[description]
+    activity_totals[description] = (sum([x.duration for x in value]), [x.notes for x in value if x.notes])
+  return activity_totals
+
+def _get_day_windows(goals, days_ago_list):
+  """
+  get_review_window for each of days_ago_list, with the start moved up to the sleep that the day starts at when the
+  day boundaries are in use, or None for a day with nothing that counts
+  """
+  windows = [get_review_window(days_ago) for days_ago in days_ago_list]
+  if not USE_DAY_BOUNDARIES:
+    return windows
+  days = get_day_boundaries(goals)
+  day_windows = []
+  for start_time, end_time, then_date in windows:
+    day_start = days.get_day_start(start_time, end_time)
+    if day_start != None:
+      #a second early, so that rounding to microseconds can't lose the sleep itself
+      day_start = max(start_time, day_start - 1)
+    day_windows.append((day_start, end_time, then_date))
+  return day_windows
+
+def get_interesting_activities(goals, days_ago):
+    start_time, end_time, then_date = _get_day_windows(goals, [days_ago])[0]
+    if start_time == None:
+      return {}, then_date
+    recent_entries = get_multi_entries_since(goals, start_time)
+    return _collect_interesting_activities(recent_entries, end_time), then_date
+
+def get_interesting_activity_totals(goals, days_ago):
+  """Like get_interesting_activities, but only the total duration and non-empty notes for each description"""
+  return get_interesting_activity_totals_by_day(goals, [days_ago])[0]
+
+def get_interesting_activity_totals_by_day(goals, days_ago_list):
+  """
+  get_interesting_activity_totals for each of days_ago_list, in the same order.  The entries for the whole span are
+  fetched once and each day's window is a bisect into them, so a month of days costs one pass instead of a month of
+  overlapping ones.
+  """
+  windows = _get_day_windows(goals, days_ago_list)
+  starts = [window[0] for window in windows if window[0] != None]
+  if len(starts) <= 0:
+    return [({}, then_date) for start_time, end_time, then_date in windows]
+  store = get_columnar_progress(goals)
+  if store != None:
+    return [({} if start_time == None else store.get_activity_totals(start_time, end_time), then_date) for start_time, end_time, then_date in windows]
+  entries = get_multi_entries_since(goals, min(starts))
+  starts = [entry.start_time for entry in entries]
+  results = []
+  for start_time, end_time, then_date in windows:
+    if start_time == None:
+      #no sleep, so nothing counts
+      results.append(({}, then_date))
+      continue
+    #the same entries that get_multi_entries_since(goals, start_time) would have returned
+    first = bisect.bisect_right(starts, start_time)
+    window_entries = (entries[i] for i in range(first, len(entries)))
+    results.append((_get_activity_totals(_collect_interesting_activities(window_entries, end_time)), then_date))
+  return results
 
 def summarize(goals, user_data, for_tags = False):
   """
@@ -515,15 +2059,9 @@ def summarize(goals, user_data, for_tags = False):
         entries_by_description[description] = [entry]
     return entries_by_description
 
-  def get_duration_for_entries(entries):
-    total_duration = 0
-    for entry in entries:
-      total_duration += entry.duration
-    return total_duration
-
-  def get_labels_sorted_by_duration(label_dict):
+  def get_labels_sorted_by_duration(label_dict, label_durations):
     labels = list(label_dict.keys())
-    labels.sort(key=lambda label: get_duration_for_entries(label_dict[label]),
+    labels.sort(key=lambda label: label_durations[label],
       reverse=True)
     return labels
 
@@ -532,18 +2070,18 @@ def summarize(goals, user_data, for_tags = False):
     minutes = int((duration/60) - (hours*60))
     return "%.2d h %.2d min" % (hours, minutes)
 
-  def print_effort(tagged_entries, start_time, end_time, pad_spaces=25):
+  def print_effort(tagged_entries, label_durations, start_time, end_time, pad_spaces=25):
     total_duration = end_time - start_time
     print("%s : %s" % (pad("Total", pad_spaces), get_human_readable_duration(total_duration)))
     print("-" * (pad_spaces+21))
-    for tag in get_labels_sorted_by_duration(tagged_entries):
-      total_tag_duration = get_duration_for_entries(tagged_entries[tag])
+    for tag in get_labels_sorted_by_duration(tagged_entries, label_durations):
+      total_tag_duration = label_durations[tag]
       print("%s - %s - %0d %%" % (pad(tag, pad_spaces),
         get_human_readable_duration(total_tag_duration), 
         round(100*total_tag_duration/total_duration)))
     print("-" * (pad_spaces+21))
-    for tag in get_labels_sorted_by_duration(tagged_entries):
-      total_tag_duration = get_duration_for_entries(tagged_entries[tag])
+    for tag in get_labels_sorted_by_duration(tagged_entries, label_durations):
+      total_tag_duration = label_durations[tag]
       print("-" * (pad_spaces+21))
       print("- %s - %s - %0d %%" % (pad(tag, pad_spaces-2),
         get_human_readable_duration(total_tag_duration), 
@@ -569,13 +2107,21 @@ def summarize(goals, user_data, for_tags = False):
   start_time = (NOW - decimal.Decimal(str(delta_to_day_start.total_seconds()))) - (days_ago_start * one_day_in_seconds) - start_extra_pad
   end_time = (NOW - decimal.Decimal(str(delta_to_day_start.total_seconds()))) - (days_ago_end * one_day_in_seconds)
   recent_entries = get_entries_in_period(goals, start_time, end_time)
-  tagged_entries = get_entries_by_tag(recent_entries, start_time, end_time)
-  desc_entries = get_entries_by_description(recent_entries, start_time, end_time)
+  if for_tags:
+    label_entries = get_entries_by_tag(recent_entries, start_time, end_time)
+    get_label = lambda goal: goal.tags[0]
+  else:
+    label_entries = get_entries_by_description(recent_entries, start_time, end_time)
+    get_label = lambda goal: goal.description
+  label_durations = dict((label, 0) for label in label_entries)
+  for goal, duration in get_goal_durations(goals, start_time, end_time).items():
+    label = get_label(goal)
+    label_durations[label] = label_durations.get(label, 0) + duration
 
   if for_tags:
-    print_effort(tagged_entries, start_time, end_time, pad_spaces=10)
+    print_effort(label_entries, label_durations, start_time, end_time, pad_spaces=10)
   else:
-    print_effort(desc_entries, start_time, end_time, pad_spaces=25)
+    print_effort(label_entries, label_durations, start_time, end_time, pad_spaces=25)
 
   
 def fancy_tri_column_print(a, b, c, col_width, spacing):
@@ -627,6 +2173,9 @@ def pad(data, maxLen):
       return data[:maxLen]
   
 class Entry():
+  #reports make one of these per progress row, so they skip the per-instance dict
+  __slots__ = ("start_time", "end_time", "focus", "notes", "duration", "goal")
+
   def __init__(self, progress_data, goal):
     self.start_time = progress_data[0]
     self.end_time = progress_data[1]
@@ -659,6 +2208,8 @@ class Entry():
     return "[%s] %s to %s (for %.2d:%.2d) %s" % (tag_string, formatted_starttime, formatted_endtime, hours, minutes, self.goal.description)  + ': ' + self.notes
 
 class MultiEntry():
+  __slots__ = ("entries", "start_time", "end_time", "duration")
+
   def __init__(self, entry):
     self.entries = [entry]
     self.start_time = entry.start_time
@@ -708,99 +2259,1904 @@ class MultiEntry():
     descriptions = " and ".join([entry.goal.description[:40] for entry in self.entries])
     return "[%s] %s to %s (for %.2d:%.2d) %s" % (tag_string, formatted_starttime, formatted_endtime, hours, minutes, descriptions)  + ': ' + entry.notes
     
-def get_multi_entries_since(goals, start_time):
-  recent_goals = []
-  for goal in goals:
-    if goal.last_updated_at == None:
+class IntervalIndex():
+  """
+  Every progress row of the loaded goals, sorted by start time, so that range queries are a bisect and a slice.
+  Goals are only pulled in once a query reaches back past their last update, so a launcher that only looks at
+  the last week never pays for anybody's whole history.
+  """
+  def __init__(self, goals):
+    self.goals = goals
+    #every row of every goal updated after this time is in the index
+    self.horizon = None
+    self.starts = []
+    #(start, goal order, row number) keeps ties in the same order that sorting every goal's progress would
+    self.keys = []
+    self.rows = []
+    self.goal_order = dict((goal.id, i) for i, goal in enumerate(goals))
+    self.indexed_goal_ids = set()
+    #goals that were replaced, added or removed (None) since the index was made, by id
+    self.changed_goals = {}
+
+  def _get_goals(self):
+    for goal in self.goals:
+      if goal.id not in self.changed_goals:
+        yield goal
+    for goal in self.changed_goals.values():
+      if goal != None:
+        yield goal
+
+  def cover(self, start_time):
+    """Make sure that every row starting after start_time is in the index"""
+    if self.horizon != None and self.horizon <= start_time:
+      return
+    for goal in self._get_goals():
+      if goal.id in self.indexed_goal_ids:
+        continue
+      if goal.last_updated_at == None or goal.last_updated_at <= start_time:
+        continue
+      self._add_goal(goal)
+    self.horizon = start_time
+
+  def _add_goal(self, goal):
+    self.indexed_goal_ids.add(goal.id)
+    if goal.id not in self.goal_order:
+      self.goal_order[goal.id] = len(self.goal_order)
+    for row_number in range(0, len(goal.progress)):
+      self._insert(goal, row_number)
+
+  def _insert(self, goal, row_number):
+    row = goal.progress[row_number]
+    key = (row[0], self.goal_order[goal.id], row_number)
+    position = bisect.bisect_right(self.keys, key)
+    self.starts.insert(position, row[0])
+    self.keys.insert(position, key)
+    self.rows.insert(position, (row, goal))
+
+  def replace_goal(self, old_goal, new_goal):
+    was_indexed = old_goal.id in self.indexed_goal_ids
+    self.remove_goal(old_goal)
+    self.changed_goals[new_goal.id] = new_goal
+    if was_indexed or (self.horizon != None and new_goal.last_updated_at > self.horizon):
+      self._add_goal(new_goal)
+
+  def add_goal(self, goal):
+    self.changed_goals[goal.id] = goal
+    if self.horizon != None and goal.last_updated_at != None and goal.last_updated_at > self.horizon:
+      self._add_goal(goal)
+
+  def remove_goal(self, goal):
+    if goal.id in self.indexed_goal_ids:
+      kept = [i for i in range(0, len(self.rows)) if self.rows[i][1] is not goal]
+      self.starts = [self.starts[i] for i in kept]
+      self.keys = [self.keys[i] for i in kept]
+      self.rows = [self.rows[i] for i in kept]
+      self.indexed_goal_ids.discard(goal.id)
+    self.changed_goals[goal.id] = None
+
+  def add_row(self, goal, row):
+    if goal.id not in self.indexed_goal_ids:
+      #its older rows were never needed before, but they will be if the horizon ever moves back
+      self._add_goal(goal)
+    else:
+      self._insert(goal, len(goal.progress)-1)
+
+  def remove_row(self, goal, row, row_number):
+    if goal.id not in self.indexed_goal_ids:
+      return
+    key = (row[0], self.goal_order[goal.id], row_number)
+    position = bisect.bisect_left(self.keys, key)
+    if position < len(self.keys) and self.keys[position] == key:
+      del self.starts[position]
+      del self.keys[position]
+      del self.rows[position]
+
+  def all_rows(self):
+    """(row, goal) for every row of every goal, in order"""
+    self.cover(decimal.Decimal("-Infinity"))
+    return self.rows
+
+  def rows_after(self, start_time):
+    """(row, goal) for every row starting strictly after start_time, in order"""
+    self.cover(start_time)
+    return self.rows[bisect.bisect_right(self.starts, start_time):]
+
+  def rows_starting_between(self, start_time, end_time, include_end=False):
+    """(row, goal) for every row starting at or after start_time and before end_time, in order"""
+    self.cover(start_time)
+    low = bisect.bisect_left(self.starts, start_time)
+    if include_end:
+      high = bisect.bisect_right(self.starts, end_time)
+    else:
+      high = bisect.bisect_left(self.starts, end_time)
+    return self.rows[low:high]
+
+  def rows_in_period(self, start_time, end_time):
+    """(row, goal) for every row that starts and ends within the period, in order"""
+    self.cover(start_time)
+    low = bisect.bisect_left(self.starts, start_time)
+    high = bisect.bisect_right(self.starts, end_time)
+    return [(row, goal) for row, goal in self.rows[low:high] if row[1] <= end_time]
+
+  def iter_rows_in_period(self, start_time, end_time):
+    """The same rows as rows_in_period, without making a list of them"""
+    self.cover(start_time)
+    position = bisect.bisect_left(self.starts, start_time)
+    high = bisect.bisect_right(self.starts, end_time)
+    while position < high:
+      row, goal = self.rows[position]
+      if row[1] <= end_time:
+        yield row, goal
+      position += 1
+
+#only used when numpy is available
+USE_COLUMNAR_PROGRESS = False
+
+def _import_numpy():
+  global numpy
+  if numpy == None:
+    try:
+      import numpy
+    except ImportError:
+      numpy = False
+  return numpy
+
+MICROSECONDS = decimal.Decimal(1000000)
+
+def _to_microseconds(value):
+  return int((value * MICROSECONDS).to_integral_value())
+
+def _from_microseconds(value):
+  return decimal.Decimal(int(value)).scaleb(-6)
+
+class ColumnarProgress():
+  """
+  Parallel numpy arrays over every progress row, in the same order as the interval index, so that reports are masked
+  reductions instead of adding up Decimals one row at a time.  Times are integer microseconds.
+  Rows that start and end together are grouped the same way that get_multi_entries_since merges them.
+  """
+  def __init__(self, index):
+    rows = index.all_rows()
+    self.goals = []
+    self.goal_positions = {}
+    starts = []
+    ends = []
+    focuses = []
+    positions = []
+    notes_offsets = [0]
+    notes = []
+    #one entry per group of simultaneous rows, stored against the group's first row
+    group_heads = []
+    self.group_notes = {}
+    group_activities = []
+    group_sleeping = []
+    self.activity_names = []
+    activity_ids = {}
+    group = None
+    for row, goal in rows:
+      if goal.id not in self.goal_positions:
+        self.goal_positions[goal.id] = len(self.goals)
+        self.goals.append(goal)
+      starts.append(_to_microseconds(row[0]))
+      ends.append(_to_microseconds(row[1]))
+      focuses.append(float(row[2]))
+      positions.append(self.goal_positions[goal.id])
+      notes.append(row[3])
+      notes_offsets.append(notes_offsets[-1] + len(row[3]))
+      entry = Entry(row, goal)
+      if group != None and group.is_same_time(entry):
+        group.add(entry)
+        group_heads.append(False)
+        group_activities.append(0)
+        group_sleeping.append(False)
+        continue
+      if group != None:
+        self._finish_group(group, group_head_row, group_activities, group_sleeping, activity_ids)
+      group = MultiEntry(entry)
+      group_head_row = len(group_heads)
+      group_heads.append(True)
+      group_activities.append(0)
+      group_sleeping.append(False)
+    if group != None:
+      self._finish_group(group, group_head_row, group_activities, group_sleeping, activity_ids)
+    self.start = numpy.array(starts, dtype=numpy.int64)
+    self.end = numpy.array(ends, dtype=numpy.int64)
+    self.focus = numpy.array(focuses, dtype=numpy.float64)
+    self.goal_position = numpy.array(positions, dtype=numpy.int64)
+    self.goal_id = numpy.array([goal.id for goal in self.goals], dtype=numpy.int64)[self.goal_position]
+    self.notes_offset = numpy.array(notes_offsets, dtype=numpy.int64)
+    self.notes_text = "".join(notes)
+    self.duration = self.end - self.start
+    self.group_head = numpy.array(group_heads, dtype=bool)
+    self.group_activity = numpy.array(group_activities, dtype=numpy.int64)
+    self.group_sleeping = numpy.array(group_sleeping, dtype=bool)
+    self.group_has_notes = numpy.zeros(len(starts), dtype=bool)
+    self.group_has_notes[list(self.group_notes.keys())] = True
+
+  def _finish_group(self, group, head_row, group_activities, group_sleeping, activity_ids):
+    name = get_activity_description(group)
+    if name not in activity_ids:
+      activity_ids[name] = len(self.activity_names)
+      self.activity_names.append(name)
+    group_activities[head_row] = activity_ids[name]
+    group_sleeping[head_row] = 'sleep' in group.description
+    if group.notes:
+      self.group_notes[head_row] = group.notes
+
+  def get_notes(self, row_number):
+    return self.notes_text[self.notes_offset[row_number]:self.notes_offset[row_number+1]]
+
+  def get_durations_by_goal(self, start_time, end_time):
+    """{goal: total duration} over the rows that get_entries_in_period would return"""
+    start_us = _to_microseconds(start_time)
+    end_us = _to_microseconds(end_time)
+    low = numpy.searchsorted(self.start, start_us, "left")
+    high = numpy.searchsorted(self.start, end_us, "right")
+    inside = self.end[low:high] <= end_us
+    positions = self.goal_position[low:high][inside]
+    totals = numpy.bincount(positions, weights=self.duration[low:high][inside], minlength=len(self.goals))
+    counts = numpy.bincount(positions, minlength=len(self.goals))
+    return dict((self.goals[position], _from_microseconds(totals[position])) for position in numpy.nonzero(counts)[0].tolist())
+
+  def get_activity_totals(self, start_time, end_time):
+    """{description: (total duration, notes)} over a review window, following get_interesting_activities' rules"""
+    end_us = _to_microseconds(end_time)
+    low = numpy.searchsorted(self.start, _to_microseconds(start_time), "right")
+    high = numpy.searchsorted(self.start, end_us, "left")
+    rows = low + numpy.nonzero(self.group_head[low:high] & (self.end[low:high] < end_us))[0]
+    sleeping = self.group_sleeping[rows]
+    if not sleeping.any():
+      return {}
+    #nothing counts until the first sleep, and sleep itself never counts
+    after_sleep = numpy.argmax(sleeping) + 1
+    rows = rows[after_sleep:][~sleeping[after_sleep:]]
+    activities = self.group_activity[rows]
+    totals = numpy.bincount(activities, weights=self.duration[rows])
+    activity_totals = {}
+    unique_activities, first_rows = numpy.unique(activities, return_index=True)
+    for activity in unique_activities[numpy.argsort(first_rows)].tolist():
+      activity_totals[self.activity_names[activity]] = (_from_microseconds(totals[activity]), [])
+    for row in rows[self.group_has_notes[rows]].tolist():
+      activity_totals[self.activity_names[self.group_activity[row]]][1].append(self.group_notes[row])
+    return activity_totals
+
+INTERVAL_FILE = "goals/intervals.dat"
+#when set, reports find the rows in a period through INTERVAL_FILE instead of the interval index
+USE_INTERVAL_FILE = True
+#integers per record: start, end and focus in microseconds, goal id, row number
+INTERVAL_RECORD_FIELDS = 5
+#magic, record count, length of the goal table that follows the records
+INTERVAL_HEADER = struct.Struct("<8sqq")
+#records are in native byte order, so a file from a machine that disagrees is rebuilt rather than misread
+INTERVAL_MAGIC = b"TLIVL2" + sys.byteorder[0:2].encode("ascii")
+
+class PackedIntervals():
+  """
+  Every progress row as a fixed size record of integers, sorted by start time, kept in INTERVAL_FILE and read
+  through mmap, so that a range scan only touches the pages that the range covers.  Everything else about a row,
+  like its notes, comes from its goal once the row is actually wanted.
+  """
+  def __init__(self):
+    #{goal id: progress signature} as of the last update
+    self.goals = {}
+    #bumped whenever a query finds a goal's records out of date and has to redo them
+    self.redo_count = 0
+    #array of the records while they are being changed, a memoryview over the mapped file until then
+    self.records = array.array("q")
+    self.count = 0
+    self._map = None
+    #position of the first record that the file doesn't have yet, or None when the whole file has to be replaced
+    self._unsaved_from = None
+    #of INTERVAL_FILE as we last read or wrote it, anybody else writing it means it has to be replaced
+    self._file_signature = None
+
+  @staticmethod
+  def load():
+    """The intervals in INTERVAL_FILE, or None if there aren't any usable ones"""
+    if not os.path.exists(INTERVAL_FILE):
+      return None
+    #writers change the file in place, so the header and the table have to be read while none of them is
+    with FileLock(LOCK_DIRECTORY + "/intervals.lock"):
+      return PackedIntervals._read_file()
+
+  @staticmethod
+  def _read_file():
+    in_file = open(INTERVAL_FILE, "rb")
+    try:
+      header = in_file.read(INTERVAL_HEADER.size)
+      if len(header) < INTERVAL_HEADER.size:
+        return None
+      magic, count, table_length = INTERVAL_HEADER.unpack(header)
+      if magic != INTERVAL_MAGIC:
+        return None
+      records_end = INTERVAL_HEADER.size + count * INTERVAL_RECORD_FIELDS * 8
+      in_file.seek(records_end)
+      try:
+        table = json.loads(in_file.read(table_length).decode("utf-8"))
+      except ValueError:
+        return None
+      intervals = PackedIntervals()
+      intervals._file_signature = _get_file_signature(INTERVAL_FILE)
+      intervals._unsaved_from = count
+      for goal_id, signature in table.items():
+        intervals.goals[int(goal_id)] = signature
+      intervals.count = count
+      if count > 0:
+        import mmap
+        intervals._map = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        intervals.records = memoryview(intervals._map)[INTERVAL_HEADER.size:records_end].cast("q")
+    finally:
+      in_file.close()
+    return intervals
+
+  @staticmethod
+  def build(goals):
+    intervals = PackedIntervals()
+    records = sorted((record for goal in goals for record in PackedIntervals._get_records(goal)), key=PackedIntervals._get_record_key)
+    for record in records:
+      intervals.records.extend(record)
+    intervals.count = len(records)
+    for goal in goals:
+      intervals.goals[goal.id] = goal.get_progress_signature()
+    return intervals
+
+  def save(self):
+    """
+    Write what changed since the last save.  Rows are nearly always added at the end, so that is usually a record
+    or two and the goal table after them, written in place.  The whole file is only replaced after a resync, or when
+    another process wrote it since we last did.
+    """
+    if _deferred_saves != None:
+      #written along with the goals at the end of the batch
+      return
+    self._write()
+
+  def _write(self):
+    self._make_writable()
+    table = json.dumps(dict((str(goal_id), signature) for goal_id, signature in self.goals.items()), sort_keys=True).encode("utf-8")
+    header = INTERVAL_HEADER.pack(INTERVAL_MAGIC, self.count, len(table))
+    with FileLock(LOCK_DIRECTORY + "/intervals.lock"):
+      if self._unsaved_from == None or not os.path.exists(INTERVAL_FILE) or _get_file_signature(INTERVAL_FILE) != self._file_signature:
+        _replace_file(INTERVAL_FILE, header + self.records.tobytes() + table)
+      else:
+        fields = INTERVAL_RECORD_FIELDS
+        out_file = open(INTERVAL_FILE, "r+b")
+        #the file is never made shorter, because other processes may have it mapped, so a removed row leaves a few
+        #bytes past the end of the table that nothing reads
+        out_file.seek(INTERVAL_HEADER.size + self._unsaved_from * fields * 8)
+        out_file.write(self.records[self._unsaved_from*fields:].tobytes() + table)
+        out_file.seek(0)
+        out_file.write(header)
+        out_file.close()
+      self._file_signature = _get_file_signature(INTERVAL_FILE)
+    self._unsaved_from = self.count
+
+  def _mark_unsaved(self, position):
+    if self._unsaved_from != None:
+      self._unsaved_from = min(self._unsaved_from, position)
+
+  def _make_writable(self):
+    """Copy the records out of the mapped file, which is about to be changed or replaced"""
+    if self._map == None:
+      return
+    records = array.array("q")
+    records.frombytes(self.records.tobytes())
+    self.records.release()
+    self.records = records
+    try:
+      self._map.close()
+    except BufferError:
+      #somebody still has a view of it, it is closed when they let go
+      pass
+    self._map = None
+
+  @staticmethod
+  def _get_record(goal, row_number):
+    row = goal.progress[row_number]
+    return (_to_microseconds(row[0]), _to_microseconds(row[1]), _to_microseconds(row[2]), goal.id, row_number)
+
+  @staticmethod
+  def _get_records(goal):
+    return [PackedIntervals._get_record(goal, row_number) for row_number in range(0, len(goal.progress))]
+
+  @staticmethod
+  def _get_record_key(record):
+    #(start, goal id, row number), which is what _find searches by
+    return (record[0], record[3], record[4])
+
+  def _get_key(self, position):
+    offset = position * INTERVAL_RECORD_FIELDS
+    return (self.records[offset], self.records[offset+3], self.records[offset+4])
+
+  def _find(self, key):
+    """Position of the first record whose (start, goal id, row number) is not below key"""
+    low = 0
+    high = self.count
+    while low < high:
+      middle = (low + high) // 2
+      if self._get_key(middle) < key:
+        low = middle + 1
+      else:
+        high = middle
+    return low
+
+  def redo_goals(self, goals, removed_ids=()):
+    """Replace the records of goals with their rows as they are now, and drop the records of removed_ids"""
+    self._make_writable()
+    redo_ids = set(removed_ids).union(goal.id for goal in goals)
+    fields = INTERVAL_RECORD_FIELDS
+    old = self.records
+    kept = array.array("q")
+    run_start = 0
+    for position, goal_id in enumerate(old[3::fields]):
+      if goal_id in redo_ids:
+        kept.extend(old[run_start*fields:position*fields])
+        run_start = position + 1
+    kept.extend(old[run_start*fields:])
+    self.records = kept
+    self.count = len(kept) // fields
+    #the new records are slotted in between runs of the kept ones, which are copied across a run at a time
+    merged = array.array("q")
+    previous = 0
+    new_records = sorted((record for goal in goals for record in PackedIntervals._get_records(goal)), key=PackedIntervals._get_record_key)
+    for record in new_records:
+      position = self._find(record[0:1] + record[3:5])
+      merged.extend(kept[previous*fields:position*fields])
+      merged.extend(record)
+      previous = position
+    merged.extend(kept[previous*fields:])
+    self.records = merged
+    self.count = len(merged) // fields
+    for goal_id in removed_ids:
+      self.goals.pop(goal_id, None)
+    for goal in goals:
+      self.goals[goal.id] = goal.get_progress_signature()
+    self._unsaved_from = None
+
+  @staticmethod
+  def write_row(goal, row, row_number, sign, was):
+    """add_row, or remove_row if sign is -1, for when the intervals aren't loaded, written straight to the file"""
+    intervals = PackedIntervals.load()
+    if intervals == None:
+      return
+    if sign > 0:
+      intervals.add_row(goal, row, was)
+    else:
+      intervals.remove_row(goal, row, row_number, was)
+    #even in a batch, since nobody else is going to
+    intervals._write()
+
+  def add_row(self, goal, row, was):
+    """Add a row that was added to goal when its progress signature was was"""
+    if self.goals.get(goal.id) != was:
+      #we were already behind on the goal, so it is redone rather than changed
+      self.redo_goals([goal])
+      return
+    self._make_writable()
+    record = PackedIntervals._get_record(goal, len(goal.progress)-1)
+    position = self._find(record[0:1] + record[3:5])
+    offset = position * INTERVAL_RECORD_FIELDS
+    self.records[offset:offset] = array.array("q", record)
+    self.count += 1
+    self._mark_unsaved(position)
+    self.goals[goal.id] = goal.get_progress_signature()
+
+  def remove_row(self, goal, row, row_number, was):
+    """Take away the record of row_number, which was removed from goal when its progress signature was was"""
+    if self.goals.get(goal.id) != was:
+      self.redo_goals([goal])
+      return
+    self._make_writable()
+    key = (_to_microseconds(row[0]), goal.id, row_number)
+    position = self._find(key)
+    if position < self.count and self._get_key(position) == key:
+      offset = position * INTERVAL_RECORD_FIELDS
+      del self.records[offset:offset+INTERVAL_RECORD_FIELDS]
+      self.count -= 1
+      self._mark_unsaved(position)
+    self.goals[goal.id] = goal.get_progress_signature()
+
+  def sync(self, goals):
+    """
+    Redo any goal that changed without us seeing it, eg. in another process or by hand.  Returns whether anything
+    changed
+    """
+    changed_goals = [goal for goal in goals if self.goals.get(goal.id) != goal.get_progress_signature()]
+    removed_ids = set(self.goals.keys()).difference(goal.id for goal in goals).difference(_get_archived_ids(goals))
+    if len(changed_goals) <= 0 and len(removed_ids) <= 0:
+      return False
+    self.redo_goals(changed_goals, removed_ids)
+    return True
+
+  def _get_range(self, start_time, end_time):
+    """Positions of the records that may start within the period, with a microsecond to spare on either side"""
+    return self._find((_to_microseconds(start_time) - 1,)), self._find((_to_microseconds(end_time) + 2,))
+
+  @staticmethod
+  def _is_record_of(records, offset, progress, row_number):
+    if row_number >= len(progress):
+      return False
+    row = progress[row_number]
+    return records[offset] == _to_microseconds(row[0]) and records[offset+1] == _to_microseconds(row[1])
+
+  def _iter_rows(self, goals, start_time, end_time, accepts, ending_by=None):
+    """
+    (row, goal, index key) for the records that may start within the period, in file order, for the rows that accepts
+    lets through.  Records that end well after ending_by are skipped without looking at their rows.
+    """
+    goal_dict = dict((goal.id, goal) for goal in goals)
+    order = get_interval_index(goals).goal_order
+    end_us = None
+    if ending_by != None:
+      end_us = _to_microseconds(ending_by) + 1
+    records = self.records
+    low, high = self._get_range(start_time, end_time)
+    position = low
+    while position < high:
+      offset = position * INTERVAL_RECORD_FIELDS
+      position += 1
+      if (end_us != None and records[offset+1] > end_us) or records[offset+3] not in goal_dict:
+        continue
+      goal = goal_dict[records[offset+3]]
+      row_number = records[offset+4]
+      if not PackedIntervals._is_record_of(records, offset, goal.progress, row_number):
+        #the goal changed without its signature showing it, so its records are redone and the scan goes on from
+        #here.  _collect_rows starts over, for any of its rows that now come before this point
+        key = self._get_key(position-1)
+        self.redo_goals([goal])
+        self.save()
+        self.redo_count += 1
+        records = self.records
+        low, high = self._get_range(start_time, end_time)
+        position = self._find(key)
+        continue
+      #the exact comparison is done on the row itself, which is only looked up now
+      row = goal.progress[row_number]
+      if accepts(row):
+        yield row, goal, (row[0], order.get(goal.id, len(order)), row_number)
+
+  def _get_sorted_rows(self, rows):
+    #the file breaks ties on goal id, the index on goal order
+    rows = list(rows)
+    rows.sort(key=lambda row: row[2])
+    return [(row, goal) for row, goal, key in rows]
+
+  def _collect_rows(self, goals, start_time, end_time, accepts, ending_by=None):
+    """_iter_rows as a sorted list, read again from the start if a goal had to be redone on the way"""
+    while True:
+      redo_count = self.redo_count
+      rows = self._get_sorted_rows(self._iter_rows(goals, start_time, end_time, accepts, ending_by))
+      if self.redo_count == redo_count:
+        return rows
+
+  def get_rows_in_period(self, goals, start_time, end_time):
+    """(row, goal) for every row that starts and ends within the period, in the same order as the interval index"""
+    accepts = lambda row: row[0] >= start_time and row[0] <= end_time and row[1] <= end_time
+    return self._collect_rows(goals, start_time, end_time, accepts, end_time)
+
+  def iter_rows_in_period(self, goals, start_time, end_time):
+    """The same rows as get_rows_in_period, one at a time"""
+    accepts = lambda row: row[0] >= start_time and row[0] <= end_time and row[1] <= end_time
+    #only rows that start together need sorting
+    for start, rows in itertools.groupby(self._iter_rows(goals, start_time, end_time, accepts, end_time), key=lambda row: row[0][0]):
+      for row, goal in self._get_sorted_rows(rows):
+        yield row, goal
+
+  def rows_starting_between(self, goals, start_time, end_time, include_end=False):
+    """The same rows as IntervalIndex.rows_starting_between"""
+    if include_end:
+      accepts = lambda row: row[0] >= start_time and row[0] <= end_time
+    else:
+      accepts = lambda row: row[0] >= start_time and row[0] < end_time
+    return self._collect_rows(goals, start_time, end_time, accepts)
+
+  def get_durations_by_goal(self, goals, start_time, end_time):
+    """{goal: total duration} over the rows that get_entries_in_period would return, to the microsecond"""
+    goal_dict = dict((goal.id, goal) for goal in goals)
+    start_us = _to_microseconds(start_time)
+    end_us = _to_microseconds(end_time)
+    records = self.records
+    totals = {}
+    low, high = self._get_range(start_time, end_time)
+    for position in range(low, high):
+      offset = position * INTERVAL_RECORD_FIELDS
+      record_start = records[offset]
+      record_end = records[offset+1]
+      goal_id = records[offset+3]
+      if record_end > end_us + 1 or goal_id not in goal_dict:
+        continue
+      if abs(record_start - start_us) <= 1 or abs(record_start - end_us) <= 1 or abs(record_end - end_us) <= 1:
+        #rounded to the microsecond, the record could be on either side of the edge, so its row decides
+        goal = goal_dict[goal_id]
+        row_number = records[offset+4]
+        if not PackedIntervals._is_record_of(records, offset, goal.progress, row_number):
+          #see _iter_rows
+          self.redo_goals([goal])
+          self.save()
+          self.redo_count += 1
+          return self.get_durations_by_goal(goals, start_time, end_time)
+        row = goal.progress[row_number]
+        if row[0] < start_time or row[0] > end_time or row[1] > end_time:
+          continue
+      totals[goal_id] = totals.get(goal_id, 0) + record_end - record_start
+    return dict((goal_dict[goal_id], _from_microseconds(total)) for goal_id, total in totals.items())
+
+  def get_records(self):
+    """Every record as a tuple, in order"""
+    fields = INTERVAL_RECORD_FIELDS
+    return [tuple(self.records[position*fields:(position+1)*fields]) for position in range(0, self.count)]
+
+ROLLUP_FILE = "goals/rollups.dat"
+USE_DAILY_ROLLUPS = True
+#fold a view's log back into its file once it has this many entries
+VIEW_LOG_COMPACT_AT = 200
+
+class ViewLog():
+  """
+  Changes to a JSON view file, appended to a log beside it instead of rewriting the whole file for every row.  Entries
+  are tagged with the signature of the file they were written against, and only count while that is still the file,
+  so that replacing the file retires the log even if dropping it never happens.
+  """
+  def __init__(self, file_name):
+    self.file_name = file_name
+    self.log_file_name = file_name + ".log"
+    self.lock_file_name = LOCK_DIRECTORY + "/" + os.path.basename(file_name) + ".lock"
+    #of the file as we last read or wrote it, anybody else replacing it means it has to be replaced again
+    self.file_signature = None
+    #entries in the log as of the last read or write
+    self.count = 0
+    #entries that aren't written yet, and whether the whole file has to be replaced instead
+    self.entries = []
+    self.replace = True
+
+  def read(self):
+    """(data, entries) from the file and its log, or None if there is no file"""
+    with FileLock(self.lock_file_name):
+      if not os.path.exists(self.file_name):
+        return None
+      in_file = open(self.file_name, "r")
+      data = json.loads(in_file.read(), parse_float=decimal.Decimal)
+      in_file.close()
+      self.file_signature = _get_file_signature(self.file_name)
+      entries = []
+      if os.path.exists(self.log_file_name):
+        in_file = open(self.log_file_name, "r")
+        for line in in_file:
+          try:
+            entry = json.loads(line)
+          except ValueError:
+            #a torn final line from a process that died mid-append
+            continue
+          if entry.get("base") == list(self.file_signature):
+            entries.append(entry)
+        in_file.close()
+      self.count = len(entries)
+      self.replace = False
+      return data, entries
+
+  def add(self, entry):
+    if not self.replace:
+      self.entries.append(entry)
+
+  def is_full(self):
+    return self.count + len(self.entries) >= VIEW_LOG_COMPACT_AT
+
+  def _append(self, entries):
+    #only with the lock held
+    out_file = open(self.log_file_name, "a")
+    for entry in entries:
+      entry["base"] = self.file_signature
+      out_file.write(json.dumps(entry, default=_serializer, sort_keys=True) + "\n")
+    out_file.close()
+    self.count += len(entries)
+
+  def append(self, entry):
+    """Write entry to the log straight away, without the file having been read, as long as there is a file"""
+    with FileLock(self.lock_file_name):
+      if os.path.exists(self.file_name):
+        self.file_signature = _get_file_signature(self.file_name)
+        self._append([entry])
+
+  def write(self, get_data):
+    """Append the entries added since the last write, or replace the file with get_data() when that is called for"""
+    with FileLock(self.lock_file_name):
+      if (self.replace or not os.path.exists(self.file_name) or _get_file_signature(self.file_name) != self.file_signature
+        or self.is_full()):
+        _replace_file(self.file_name, json.dumps(get_data(), default=_serializer, sort_keys=True))
+        self.file_signature = _get_file_signature(self.file_name)
+        if os.path.exists(self.log_file_name):
+          os.remove(self.log_file_name)
+        self.count = 0
+      elif len(self.entries) > 0:
+        self._append(self.entries)
+    self.entries = []
+    self.replace = False
+
+def _get_local_day(timestamp):
+  return datetime.date.fromtimestamp(float(timestamp))
+
+def _get_local_midnight(day):
+  return decimal.Decimal(str(time.mktime(day.timetuple())))
+
+class DailyRollups():
+  """
+  Total duration per local day and goal, and through the goal its tag and description, kept in ROLLUP_FILE so that
+  reports don't have to add up every row they cover.  A row counts towards the day that it starts on.
+  """
+  def __init__(self):
+    #{"YYYY-MM-DD": {goal id: duration}}
+    self.days = {}
+    #{goal id: {"signature": progress signature, "tags": tags, "description": description}} as of the last update
+    self.goals = {}
+    #longest row ever added, which bounds how far back a row that ends after some time can start
+    self.longest = decimal.Decimal(0)
+    self._log = ViewLog(ROLLUP_FILE)
+
+  @staticmethod
+  def load():
+    """The rollups in ROLLUP_FILE and its log, or None if there aren't any"""
+    log = ViewLog(ROLLUP_FILE)
+    read = log.read()
+    if read == None:
+      return None
+    data, entries = read
+    rollups = DailyRollups()
+    rollups.longest = decimal.Decimal(data["longest"])
+    for day, totals in data["days"].items():
+      rollups.days[day] = dict((int(goal_id), decimal.Decimal(duration)) for goal_id, duration in totals.items())
+    for goal_id, meta in data["goals"].items():
+      rollups.goals[int(goal_id)] = meta
+    for entry in entries:
+      rollups._apply(entry)
+    rollups._log = log
+    return rollups
+
+  @staticmethod
+  def build(goals):
+    rollups = DailyRollups()
+    for goal in goals:
+      rollups.add_goal(goal)
+    return rollups
+
+  def save(self):
+    if _deferred_saves != None:
+      #written along with the goals at the end of the batch
+      return
+    self._log.write(lambda: {"longest": self.longest, "days": self.days, "goals": self.goals})
+
+  def _apply(self, entry):
+    """Make a change read back from the log, see _log_change"""
+    goal_id = entry["goal"]
+    if entry.get("remove"):
+      self.remove_goal(goal_id)
+      return
+    if "was" in entry and self.goals.get(goal_id, {}).get("signature") != entry["was"]:
+      #a row added to or taken from a goal that we were already behind on, which sync redoes whole
+      if goal_id in self.goals:
+        self.goals[goal_id]["signature"] = None
+      return
+    for day, duration in entry["days"].items():
+      self._add_to_day(day, goal_id, decimal.Decimal(duration))
+    self.longest = max(self.longest, decimal.Decimal(entry["longest"]))
+    self.goals[goal_id] = entry["meta"]
+
+  def _log_change(self, goal_id, days, was=None):
+    """Log that goal_id's totals moved by {day: duration}, from when its signature was was, and what it looks like now"""
+    entry = {"goal": goal_id, "days": days, "longest": self.longest, "meta": self.goals[goal_id]}
+    if was != None:
+      entry["was"] = was
+    self._log.add(entry)
+
+  @staticmethod
+  def log_row(goal, row, sign, was):
+    """add_row, or remove_row if sign is -1, for when the rollups aren't loaded, written straight to the log"""
+    day = _get_local_day(row[0]).isoformat()
+    longest = row[1] - row[0] if sign > 0 else 0
+    ViewLog(ROLLUP_FILE).append({"goal": goal.id, "days": {day: sign * (row[1] - row[0])}, "longest": longest,
+      "meta": DailyRollups._get_meta(goal), "was": was})
+
+  def _add(self, goal_id, row, sign):
+    """Add or take away one row, returning the day that it counts towards"""
+    day = _get_local_day(row[0]).isoformat()
+    self._add_to_day(day, goal_id, sign * (row[1] - row[0]))
+    return day
+
+  def _add_to_day(self, day, goal_id, duration):
+    if day not in self.days:
+      self.days[day] = {}
+    totals = self.days[day]
+    totals[goal_id] = totals.get(goal_id, 0) + duration
+    #a day with nothing in it looks the same however it got that way
+    if totals[goal_id] == 0:
+      del totals[goal_id]
+      if len(totals) <= 0:
+        del self.days[day]
+
+  @staticmethod
+  def _get_meta(goal):
+    return {"signature": goal.get_progress_signature(), "tags": list(goal.tags), "description": goal.description}
+
+  def _remember(self, goal):
+    self.goals[goal.id] = DailyRollups._get_meta(goal)
+
+  def add_goal(self, goal):
+    days = {}
+    for row in goal.progress:
+      day = self._add(goal.id, row, 1)
+      days[day] = days.get(day, 0) + row[1] - row[0]
+      self.longest = max(self.longest, row[1] - row[0])
+    self._remember(goal)
+    self._log_change(goal.id, days)
+
+  def remove_goal(self, goal_id):
+    for day in list(self.days.keys()):
+      self.days[day].pop(goal_id, None)
+      if len(self.days[day]) <= 0:
+        del self.days[day]
+    self.goals.pop(goal_id, None)
+    self._log.add({"goal": goal_id, "remove": True})
+
+  def add_row(self, goal, row, was):
+    """Count a row that was added to goal when its progress signature was was"""
+    self._change_row(goal, row, 1, was)
+
+  def remove_row(self, goal, row, was):
+    """Take away a row that was removed from goal when its progress signature was was"""
+    self._change_row(goal, row, -1, was)
+
+  def _change_row(self, goal, row, sign, was):
+    if self.goals.get(goal.id, {}).get("signature") != was:
+      #we were already behind on the goal, so it is redone rather than changed
+      self.remove_goal(goal.id)
+      self.add_goal(goal)
+      return
+    day = self._add(goal.id, row, sign)
+    if sign > 0:
+      self.longest = max(self.longest, row[1] - row[0])
+    self._remember(goal)
+    self._log_change(goal.id, {day: sign * (row[1] - row[0])}, was)
+
+  def sync(self, goals):
+    """
+    Redo any goal that changed without us seeing it, eg. in another process or by hand.  Returns whether anything
+    changed
+    """
+    changed = False
+    goal_ids = set()
+    for goal in goals:
+      goal_ids.add(goal.id)
+      meta = self.goals.get(goal.id)
+      if meta != None and meta.get("signature") == goal.get_progress_signature():
+        if meta["tags"] != goal.tags or meta["description"] != goal.description:
+          self._remember(goal)
+          changed = True
+        continue
+      self.remove_goal(goal.id)
+      self.add_goal(goal)
+      changed = True
+    #archived goals are only left out of goals until something reaches back for them
+    for goal_id in set(self.goals.keys()).difference(goal_ids).difference(_get_archived_ids(goals)):
+      self.remove_goal(goal_id)
+      changed = True
+    if changed:
+      #cheaper to write it all out again than to log whole goals
+      self._log.replace = True
+    return changed
+
+  def get_rows(self):
+    """(day, goal id, tag, description, duration) for everything in the table"""
+    for day in sorted(self.days.keys()):
+      for goal_id, duration in sorted(self.days[day].items()):
+        meta = self.goals.get(goal_id, {"tags": [""], "description": ""})
+        yield (day, goal_id, meta["tags"][0] if meta["tags"] else "", meta["description"], duration)
+
+  def get_durations_by_goal(self, goals, start_time, end_time):
+    """{goal: total duration} over the rows that get_entries_in_period would return"""
+    goal_dict = dict((goal.id, goal) for goal in goals)
+    goal_durations = {}
+    def add(goal, duration):
+      goal_durations[goal] = goal_durations.get(goal, 0) + duration
+    first_day = _get_local_day(start_time)
+    if _get_local_midnight(first_day) < start_time:
+      first_day += datetime.timedelta(days=1)
+    last_day = _get_local_day(end_time)
+    full_start = _get_local_midnight(first_day)
+    full_end = _get_local_midnight(last_day)
+    if full_start >= full_end:
+      for row, goal in _get_rows_in_period_from_memory(goals, start_time, end_time):
+        add(goal, row[1] - row[0])
+      return goal_durations
+    day = first_day
+    while day < last_day:
+      for goal_id, duration in self.days.get(day.isoformat(), {}).items():
+        if goal_id in goal_dict:
+          add(goal_dict[goal_id], duration)
+      day += datetime.timedelta(days=1)
+    #whole days count rows that run past the end of the period, which get_entries_in_period leaves out
+    for row, goal in _get_rows_starting_between(goals, max(full_start, full_end - self.longest), full_end):
+      if row[1] > end_time:
+        add(goal, row[0] - row[1])
+    #and the partial days on either side come straight from the rows
+    for row, goal in _get_rows_starting_between(goals, start_time, full_start) + _get_rows_starting_between(goals, full_end, end_time, include_end=True):
+      if row[1] <= end_time:
+        add(goal, row[1] - row[0])
+    return goal_durations
+
+DAY_FILE = "goals/days.dat"
+#when set, review days are found through DAY_FILE instead of by looking through the entries around them for sleep
+USE_DAY_BOUNDARIES = True
+
+def _is_sleep(goal):
+  #the same test that the reviews make of each entry
+  return 'sleep' in goal.description
+
+class DayBoundaries():
+  """
+  Every logged sleep, kept in DAY_FILE, so that finding where a review day starts is a bisect instead of a look
+  through the entries around it.  A day starts at the first sleep that starts and ends inside its window, see
+  get_review_window, and runs to the end of the window.  Windows depend on the local time zone, so the days
+  themselves are only worked out, and remembered, in memory.
+  """
+  def __init__(self):
+    #{goal id: progress signature} as of the last update, for goals that are sleep
+    self.goals = {}
+    #{goal id: [(start, end), ...]} for the rows of those goals
+    self.sleeps = {}
+    #every sleep as (start, end), sorted, and the starts alone, made when first needed
+    self._intervals = None
+    self._starts = None
+    #{(window start, window end): day start or None}
+    self._days = {}
+    self._log = ViewLog(DAY_FILE)
+
+  @staticmethod
+  def load():
+    """The day boundaries in DAY_FILE and its log, or None if there aren't any"""
+    log = ViewLog(DAY_FILE)
+    read = log.read()
+    if read == None:
+      return None
+    data, entries = read
+    days = DayBoundaries()
+    for goal_id, signature in data["goals"].items():
+      days.goals[int(goal_id)] = signature
+    for goal_id, sleeps in data["sleeps"].items():
+      days.sleeps[int(goal_id)] = [(decimal.Decimal(start), decimal.Decimal(end)) for start, end in sleeps]
+    for entry in entries:
+      days._apply(entry)
+    days._log = log
+    return days
+
+  @staticmethod
+  def build(goals):
+    days = DayBoundaries()
+    for goal in goals:
+      days.add_goal(goal)
+    return days
+
+  def save(self):
+    if _deferred_saves != None:
+      #written along with the goals at the end of the batch
+      return
+    self._log.write(lambda: {"goals": self.goals, "sleeps": self.sleeps})
+
+  def _apply(self, entry):
+    """Make a change read back from the log"""
+    goal_id = entry["goal"]
+    if entry.get("remove"):
+      self.remove_goal(goal_id)
+      return
+    if "was" in entry and self.goals.get(goal_id) != entry["was"]:
+      #a row added to or taken from a goal that we were already behind on, which sync redoes whole
+      if goal_id in self.goals:
+        self.goals[goal_id] = None
+      return
+    if "sleeps" in entry:
+      self.sleeps[goal_id] = [(decimal.Decimal(start), decimal.Decimal(end)) for start, end in entry["sleeps"]]
+    elif entry.get("pop"):
+      self.sleeps[goal_id].pop()
+    else:
+      self.sleeps[goal_id].append((decimal.Decimal(entry["add"][0]), decimal.Decimal(entry["add"][1])))
+    self.goals[goal_id] = entry["signature"]
+    self._forget_days()
+
+  def _forget_days(self):
+    self._intervals = None
+    self._starts = None
+    self._days = {}
+
+  def add_goal(self, goal):
+    if not _is_sleep(goal):
+      return
+    self.goals[goal.id] = goal.get_progress_signature()
+    self.sleeps[goal.id] = [(row[0], row[1]) for row in goal.progress]
+    self._forget_days()
+    self._log.add({"goal": goal.id, "sleeps": self.sleeps[goal.id], "signature": self.goals[goal.id]})
+
+  def remove_goal(self, goal_id):
+    if goal_id in self.goals:
+      del self.goals[goal_id]
+      del self.sleeps[goal_id]
+      self._forget_days()
+      self._log.add({"goal": goal_id, "remove": True})
+
+  @staticmethod
+  def _get_row_change(goal, row, sign, was):
+    #rows only ever come off the end
+    change = {"add": [row[0], row[1]]} if sign > 0 else {"pop": True}
+    change.update({"goal": goal.id, "signature": goal.get_progress_signature(), "was": was})
+    return change
+
+  @staticmethod
+  def log_row(goal, row, sign, was):
+    """add_row, or remove_row if sign is -1, for when the day boundaries aren't loaded, written straight to the log"""
+    if _is_sleep(goal):
+      ViewLog(DAY_FILE).append(DayBoundaries._get_row_change(goal, row, sign, was))
+
+  def add_row(self, goal, row, was):
+    """Add a row that was added to goal when its progress signature was was"""
+    if _is_sleep(goal):
+      self._change_row(goal, row, 1, was)
+
+  def remove_row(self, goal, row, was):
+    """Take away a row that was removed from goal when its progress signature was was"""
+    if goal.id in self.goals:
+      self._change_row(goal, row, -1, was)
+
+  def _change_row(self, goal, row, sign, was):
+    if self.goals.get(goal.id) != was:
+      #new to us, or we were already behind on it, so it is redone rather than changed
+      self.remove_goal(goal.id)
+      self.add_goal(goal)
+      return
+    change = DayBoundaries._get_row_change(goal, row, sign, was)
+    self._apply(change)
+    self._log.add(change)
+
+  def sync(self, goals):
+    """
+    Redo any goal that changed without us seeing it, eg. in another process or by hand.  Returns whether anything
+    changed
+    """
+    changed = False
+    goal_ids = set()
+    for goal in goals:
+      goal_ids.add(goal.id)
+      if not _is_sleep(goal):
+        #or not any more
+        if goal.id in self.goals:
+          self.remove_goal(goal.id)
+          changed = True
+        continue
+      if self.goals.get(goal.id) == goal.get_progress_signature():
+        continue
+      self.add_goal(goal)
+      changed = True
+    #archived goals are only left out of goals until something reaches back for them
+    for goal_id in set(self.goals.keys()).difference(goal_ids).difference(_get_archived_ids(goals)):
+      self.remove_goal(goal_id)
+      changed = True
+    if changed:
+      #cheaper to write it all out again than to log whole goals
+      self._log.replace = True
+    return changed
+
+  def get_intervals(self):
+    """Every sleep as (start, end), in order"""
+    if self._intervals == None:
+      self._intervals = sorted(set(interval for sleeps in self.sleeps.values() for interval in sleeps))
+      self._starts = [interval[0] for interval in self._intervals]
+    return self._intervals
+
+  def get_day_start(self, window_start, window_end):
+    """Start of the sleep that a review window's day starts at, or None if nothing in the window counts"""
+    key = (window_start, window_end)
+    if key not in self._days:
+      intervals = self.get_intervals()
+      day_start = None
+      position = bisect.bisect_right(self._starts, window_start)
+      while position < len(intervals) and intervals[position][0] < window_end:
+        #a sleep that runs past the end of the window doesn't count, and the one after it might
+        if intervals[position][1] < window_end:
+          day_start = intervals[position][0]
+          break
+        position += 1
+      self._days[key] = day_start
+    return self._days[key]
+
+class TopGoals():
+  """
+  The goals that rank highest under key among those that accepts lets through, for one column of the launcher.
+  Up to twice as many as are shown are held, so that a goal dropping out can usually be replaced from what is already
+  here, and every goal that is not held ranks below every goal that is.  Keys must differ between goals.
+  """
+  def __init__(self, key, accepts, limit):
+    self.key = key
+    self.accepts = accepts
+    self.limit = limit
+    self.capacity = 2 * limit
+    #held goals and their keys, lowest first
+    self.keys = []
+    self.goals = []
+    self.held_keys = {}
+    #whether some goal that gets through was left out for lack of room
+    self.truncated = False
+    self.stale = True
+
+  def rebuild(self, goals):
+    passing = [(self.key(goal), goal) for goal in goals if self.accepts(goal)]
+    best = heapq.nlargest(self.capacity, passing, key=lambda pair: pair[0])
+    best.reverse()
+    self.keys = [pair[0] for pair in best]
+    self.goals = [pair[1] for pair in best]
+    self.held_keys = dict((goal.id, key) for key, goal in best)
+    self.truncated = len(passing) > len(best)
+    self.stale = False
+
+  def update(self, goal):
+    """Put goal where it now belongs, after it was created, changed or got time"""
+    if self.stale:
+      return
+    floor = None
+    if self.truncated and len(self.keys) > 0:
+      floor = self.keys[0]
+    old_key = self.held_keys.pop(goal.id, None)
+    if old_key != None:
+      position = bisect.bisect_left(self.keys, old_key)
+      del self.keys[position]
+      del self.goals[position]
+    if self.accepts(goal):
+      key = self.key(goal)
+      #anything below the floor may be outranked by goals that were never held
+      if floor == None or key > floor:
+        position = bisect.bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.goals.insert(position, goal)
+        self.held_keys[goal.id] = key
+    if len(self.keys) > self.capacity:
+      del self.held_keys[self.goals[0].id]
+      del self.keys[0]
+      del self.goals[0]
+      self.truncated = True
+    if self.truncated and len(self.keys) < self.limit:
+      self.stale = True
+
+  def remove(self, goal):
+    if self.stale:
+      return
+    old_key = self.held_keys.pop(goal.id, None)
+    if old_key != None:
+      position = bisect.bisect_left(self.keys, old_key)
+      del self.keys[position]
+      del self.goals[position]
+    if self.truncated and len(self.keys) < self.limit:
+      self.stale = True
+
+  def get(self, goals):
+    """The best goals, best first, where goals is everything that might get through"""
+    if self.stale:
+      self.rebuild(goals)
+    best = self.goals[-1*self.limit:]
+    best.reverse()
+    return best
+
+class Leaderboards():
+  """
+  The recent, frequent and optimal columns of the launcher for each tag set that has been asked for, kept current
+  as goals are created, edited, completed and get time, so that showing them doesn't mean sorting every goal.
+
+  Effort over the last window keeps changing as time passes without anything happening to a goal, so frequent can't
+  be held in order.  Instead the incomplete goals that were worked on inside the window are held and ranked when asked.
+  Ties go to the goal updated most recently, then to the one loaded last.
+  """
+  def __init__(self, goals, limit, window):
+    self.goals = collections.OrderedDict((goal.id, goal) for goal in goals)
+    self.positions = dict((goal.id, position) for position, goal in enumerate(goals))
+    self.limit = limit
+    self.window = window
+    #{frozenset of tags: board}
+    self.boards = {}
+
+  def _get_board(self, tags):
+    tag_set = frozenset(tags)
+    if tag_set not in self.boards:
+      matches = lambda goal: tag_set.issubset(goal.tags)
+      incomplete_matches = lambda goal: not goal.is_complete and matches(goal)
+      board = {
+        "matches": incomplete_matches,
+        "recent": TopGoals(lambda goal: (goal.last_updated_at, self.positions[goal.id]), matches, self.limit),
+        "optimal": TopGoals(lambda goal: (goal.value_rate, goal.last_updated_at, self.positions[goal.id]), incomplete_matches, self.limit),
+        "active": {},
+      }
+      for goal in self.goals.values():
+        self._update_active(board, goal)
+      self.boards[tag_set] = board
+    return self.boards[tag_set]
+
+  def _update_active(self, board, goal):
+    if board["matches"](goal) and goal.last_updated_at > NOW - self.window:
+      board["active"][goal.id] = goal
+    else:
+      board["active"].pop(goal.id, None)
+
+  def add(self, goal):
+    self.positions[goal.id] = len(self.positions)
+    self.goals[goal.id] = goal
+    self.update(goal)
+
+  def replace(self, new_goal):
+    self.goals[new_goal.id] = new_goal
+    self.update(new_goal)
+
+  def remove(self, goal):
+    self.goals.pop(goal.id, None)
+    for board in self.boards.values():
+      board["recent"].remove(goal)
+      board["optimal"].remove(goal)
+      board["active"].pop(goal.id, None)
+
+  def update(self, goal):
+    for board in self.boards.values():
+      board["recent"].update(goal)
+      board["optimal"].update(goal)
+      self._update_active(board, goal)
+
+  def get_recent(self, tags):
+    return self._get_board(tags)["recent"].get(self.goals.values())
+
+  def get_optimal(self, tags):
+    return self._get_board(tags)["optimal"].get(self.goals.values())
+
+  def get_frequent(self, tags):
+    min_time = NOW - self.window
+    active = self._get_board(tags)["active"]
+    for goal_id in [goal_id for goal_id, goal in active.items() if goal.last_updated_at <= min_time]:
+      del active[goal_id]
+    return heapq.nlargest(self.limit, active.values(),
+      key=lambda goal: (goal.get_effort_in_interval(min_time, NOW), goal.last_updated_at, self.positions[goal.id]))
+
+_interval_index = None
+_columnar_progress = None
+_daily_rollups = None
+_packed_intervals = None
+_leaderboards = None
+_day_boundaries = None
+
+def get_leaderboards(goals):
+  """The launcher's goal columns over goals, which must be the whole loaded set"""
+  global _leaderboards
+  if _leaderboards == None:
+    _leaderboards = Leaderboards(goals, NUM_TO_SHOW, one_week_in_seconds)
+  return _leaderboards
+
+def get_daily_rollups(goals):
+  """The daily rollups, brought up to date with goals, which must be the whole loaded set"""
+  global _daily_rollups
+  if _daily_rollups == None:
+    rollups = DailyRollups.load()
+    if rollups == None:
+      rollups = DailyRollups.build(goals)
+      rollups.save()
+    elif rollups.sync(goals) or rollups._log.is_full():
+      #launches that never load the rollups only ever add to the log
+      rollups.save()
+    _daily_rollups = rollups
+  return _daily_rollups
+
+def get_packed_intervals(goals):
+  """The packed interval file, brought up to date with goals, which must be the whole loaded set"""
+  global _packed_intervals
+  if _packed_intervals == None:
+    intervals = PackedIntervals.load()
+    if intervals == None:
+      intervals = PackedIntervals.build(goals)
+      intervals.save()
+    elif intervals.sync(goals):
+      intervals.save()
+    _packed_intervals = intervals
+  return _packed_intervals
+
+def verify_packed_intervals():
+  """Rebuild the interval file from the goal files and report whether the live one disagrees, then keep the rebuilt one"""
+  #archived goals are in there too
+  goals = reach_into_archive(list(load_all_goals().values()), decimal.Decimal("-Infinity"))
+  live = PackedIntervals.load()
+  rebuilt = PackedIntervals.build(goals)
+  if live == None:
+    print("There was no interval file")
+  else:
+    #see verify_daily_rollups
+    live.sync(goals)
+    live_records = set(live.get_records())
+    rebuilt_records = set(rebuilt.get_records())
+    for record in sorted(live_records.symmetric_difference(rebuilt_records)):
+      print("%s goal %s row %s: %s" % (record[0], record[3], record[4], "only live" if record in live_records else "only rebuilt"))
+    if live_records == rebuilt_records and live.get_records() == rebuilt.get_records():
+      print("Intervals match: %s rows" % rebuilt.count)
+    elif live_records == rebuilt_records:
+      print("Intervals are out of order")
+    else:
+      print("%s rows differ" % len(live_records.symmetric_difference(rebuilt_records)))
+  rebuilt.save()
+
+def verify_daily_rollups():
+  """Rebuild the rollups from the goal files and report where the live table disagrees, then keep the rebuilt ones"""
+  #archived goals are in there too
+  goals = reach_into_archive(list(load_all_goals().values()), decimal.Decimal("-Infinity"))
+  live = DailyRollups.load()
+  rebuilt = DailyRollups.build(goals)
+  live_rows = {}
+  if live != None:
+    #goals that changed where we couldn't see it are redone on every use anyway, what's left is what is wrong
+    live.sync(goals)
+    live_rows = dict(((row[0], row[1]), row) for row in live.get_rows())
+  rebuilt_rows = dict(((row[0], row[1]), row) for row in rebuilt.get_rows())
+  differences = 0
+  for key in sorted(set(live_rows.keys()).union(rebuilt_rows.keys())):
+    if live_rows.get(key) != rebuilt_rows.get(key):
+      differences += 1
+      print("%s goal %s: live %s, rebuilt %s" % (key[0], key[1], live_rows.get(key), rebuilt_rows.get(key)))
+  if live == None:
+    print("There were no rollups")
+  elif differences == 0:
+    print("Rollups match: %s days, %s goals" % (len(rebuilt.days), len(rebuilt.goals)))
+  else:
+    print("%s rows differ" % differences)
+  rebuilt.save()
+
+def _get_archived_sleep_goals(goals):
+  """Archived goals that are sleep, which day boundaries can't be built without"""
+  archive = get_archive()
+  if archive == None:
+    return []
+  goal_ids = [goal_id for goal_id in archive.get_archived_ids(goal.id for goal in goals) if 'sleep' in archive.goals[goal_id]["description"]]
+  if archive.load_goals(goal_ids):
+    #everything else has to take them in too, as it would after reach_into_archive
+    reset_derived_views()
+  return [archive.loaded[goal_id] for goal_id in goal_ids if goal_id in archive.loaded]
+
+def get_day_boundaries(goals):
+  """The day boundaries, brought up to date with goals, which must be the whole loaded set"""
+  global _day_boundaries
+  if _day_boundaries == None:
+    days = DayBoundaries.load()
+    if days == None:
+      days = DayBoundaries.build(list(goals) + _get_archived_sleep_goals(goals))
+      days.save()
+    elif days.sync(goals) or days._log.is_full():
+      #launches that never load the day boundaries only ever add to the log
+      days.save()
+    _day_boundaries = days
+  return _day_boundaries
+
+def verify_day_boundaries():
+  """Rebuild the day boundaries from the goal files and report whether the live ones disagree, then keep the rebuilt ones"""
+  goals = list(load_all_goals().values())
+  goals = goals + _get_archived_sleep_goals(goals)
+  live = DayBoundaries.load()
+  rebuilt = DayBoundaries.build(goals)
+  if live == None:
+    print("There were no day boundaries")
+  else:
+    #see verify_daily_rollups
+    live.sync(goals)
+    live_intervals = set(live.get_intervals())
+    rebuilt_intervals = set(rebuilt.get_intervals())
+    for interval in sorted(live_intervals.symmetric_difference(rebuilt_intervals)):
+      print("sleep %s to %s: %s" % (interval[0], interval[1], "only live" if interval in live_intervals else "only rebuilt"))
+    if live_intervals == rebuilt_intervals:
+      print("Day boundaries match: %s sleeps" % len(rebuilt_intervals))
+    else:
+      print("%s sleeps differ" % len(live_intervals.symmetric_difference(rebuilt_intervals)))
+  rebuilt.save()
+
+def _use_interval_file():
+  #the file is built from goal files, other storages answer range queries themselves
+  return USE_INTERVAL_FILE and isinstance(get_storage(), JsonDirectoryStorage)
+
+def _get_rows_in_period_from_memory(goals, start_time, end_time):
+  if _use_interval_file():
+    return get_packed_intervals(goals).get_rows_in_period(goals, start_time, end_time)
+  return get_interval_index(goals).rows_in_period(start_time, end_time)
+
+def _get_rows_starting_between(goals, start_time, end_time, include_end=False):
+  #the index would have to pull in every goal updated since start_time, the file only reads the rows asked for
+  if _use_interval_file():
+    return get_packed_intervals(goals).rows_starting_between(goals, start_time, end_time, include_end)
+  return get_interval_index(goals).rows_starting_between(start_time, end_time, include_end)
+
+def get_interval_index(goals):
+  """The interval index over goals, which must be the whole loaded set"""
+  global _interval_index
+  if _interval_index == None:
+    _interval_index = IntervalIndex(goals)
+  return _interval_index
+
+def get_columnar_progress(goals):
+  """The columnar store over goals, or None when it is turned off or numpy is missing"""
+  global _columnar_progress
+  if not USE_COLUMNAR_PROGRESS or not _import_numpy():
+    return None
+  if _columnar_progress == None:
+    _columnar_progress = ColumnarProgress(get_interval_index(goals))
+  return _columnar_progress
+
+def get_goal_durations(goals, start_time, end_time):
+  """{goal: total duration} over the rows that get_entries_in_period would return"""
+  goals = reach_into_archive(goals, start_time)
+  return get_storage().get_durations_by_goal(goals, start_time, end_time)
+
+def _get_goal_durations_in_memory(goals, start_time, end_time):
+  store = get_columnar_progress(goals)
+  if store != None:
+    return store.get_durations_by_goal(start_time, end_time)
+  if USE_DAILY_ROLLUPS:
+    return get_daily_rollups(goals).get_durations_by_goal(goals, start_time, end_time)
+  if _use_interval_file():
+    return get_packed_intervals(goals).get_durations_by_goal(goals, start_time, end_time)
+  goal_durations = {}
+  for entry in get_entries_in_period(goals, start_time, end_time):
+    goal_durations[entry.goal] = goal_durations.get(entry.goal, 0) + entry.duration
+  return goal_durations
+
+def reset_derived_views():
+  """Forget everything that was built from the previously loaded goals"""
+  global _interval_index, _columnar_progress, _title_index, _daily_rollups, _packed_intervals, _leaderboards, _day_boundaries
+  _interval_index = None
+  _columnar_progress = None
+  _title_index = None
+  _daily_rollups = None
+  _packed_intervals = None
+  _leaderboards = None
+  _day_boundaries = None
+
+def _notify_goal_added(goal):
+  """Keep the derived views current when a goal is created"""
+  global _columnar_progress
+  if _interval_index != None:
+    _interval_index.add_goal(goal)
+  if len(goal.progress) > 0:
+    #a goal file that turned up with a history of its own
+    _columnar_progress = None
+    if _daily_rollups != None:
+      _daily_rollups.add_goal(goal)
+      _daily_rollups.save()
+    if _packed_intervals != None:
+      _packed_intervals.redo_goals([goal])
+      _packed_intervals.save()
+    if _day_boundaries != None and _is_sleep(goal):
+      _day_boundaries.add_goal(goal)
+      _day_boundaries.save()
+  if _title_index != None:
+    _title_index.add(goal)
+  if _leaderboards != None:
+    _leaderboards.add(goal)
+
+def _notify_goal_removed(goal):
+  """Keep the derived views current when a goal's file is deleted"""
+  global _columnar_progress
+  if _interval_index != None:
+    _interval_index.remove_goal(goal)
+  _columnar_progress = None
+  if _title_index != None:
+    _title_index.remove(goal.id)
+  if _daily_rollups != None:
+    _daily_rollups.remove_goal(goal.id)
+    _daily_rollups.save()
+  if _packed_intervals != None:
+    _packed_intervals.redo_goals([], [goal.id])
+    _packed_intervals.save()
+  if _day_boundaries != None and goal.id in _day_boundaries.goals:
+    _day_boundaries.remove_goal(goal.id)
+    _day_boundaries.save()
+  if _leaderboards != None:
+    _leaderboards.remove(goal)
+
+def _notify_goal_replaced(old_goal, new_goal):
+  """Keep the derived views current when a goal is re-read from its file"""
+  global _columnar_progress
+  if _interval_index != None:
+    _interval_index.replace_goal(old_goal, new_goal)
+  _columnar_progress = None
+  if _title_index != None:
+    _title_index.update(new_goal)
+  if _daily_rollups != None:
+    _daily_rollups.remove_goal(old_goal.id)
+    _daily_rollups.add_goal(new_goal)
+    _daily_rollups.save()
+  if _packed_intervals != None:
+    _packed_intervals.redo_goals([new_goal], [old_goal.id])
+    _packed_intervals.save()
+  if _day_boundaries != None and (old_goal.id in _day_boundaries.goals or _is_sleep(new_goal)):
+    _day_boundaries.remove_goal(old_goal.id)
+    _day_boundaries.add_goal(new_goal)
+    _day_boundaries.save()
+  if _leaderboards != None:
+    _leaderboards.replace(new_goal)
+
+def _notify_row_added(goal, row, was):
+  """
+  Keep the derived views current when a row is appended to a goal's progress, was being its progress signature before.
+  The files that reports read are kept current even when they aren't loaded, so that the next report doesn't have to
+  redo the goal
+  """
+  global _columnar_progress
+  if _interval_index != None:
+    _interval_index.add_row(goal, row)
+  _columnar_progress = None
+  if _daily_rollups != None:
+    _daily_rollups.add_row(goal, row, was)
+    _daily_rollups.save()
+  elif USE_DAILY_ROLLUPS:
+    DailyRollups.log_row(goal, row, 1, was)
+  if _packed_intervals != None:
+    _packed_intervals.add_row(goal, row, was)
+    _packed_intervals.save()
+  elif _use_interval_file():
+    PackedIntervals.write_row(goal, row, len(goal.progress)-1, 1, was)
+  if _day_boundaries != None:
+    _day_boundaries.add_row(goal, row, was)
+    _day_boundaries.save()
+  elif USE_DAY_BOUNDARIES:
+    DayBoundaries.log_row(goal, row, 1, was)
+  if _leaderboards != None:
+    _leaderboards.update(goal)
+
+def _notify_row_removed(goal, row, row_number, was):
+  """
+  Keep the derived views current when the last row, row_number, has been removed from a goal's progress, was being its
+  progress signature before, see _notify_row_added
+  """
+  global _columnar_progress
+  if _interval_index != None:
+    _interval_index.remove_row(goal, row, row_number)
+  _columnar_progress = None
+  if _daily_rollups != None:
+    _daily_rollups.remove_row(goal, row, was)
+    _daily_rollups.save()
+  elif USE_DAILY_ROLLUPS:
+    DailyRollups.log_row(goal, row, -1, was)
+  if _packed_intervals != None:
+    _packed_intervals.remove_row(goal, row, row_number, was)
+    _packed_intervals.save()
+  elif _use_interval_file():
+    PackedIntervals.write_row(goal, row, row_number, -1, was)
+  if _day_boundaries != None:
+    _day_boundaries.remove_row(goal, row, was)
+    _day_boundaries.save()
+  elif USE_DAY_BOUNDARIES:
+    DayBoundaries.log_row(goal, row, -1, was)
+  if _leaderboards != None:
+    _leaderboards.update(goal)
+
+def _iter_goal_rows_after(goal, start_time, goal_order, reverse):
+  """(key, row, goal) for each of goal's rows starting strictly after start_time, by start, for merging with others"""
+  progress = goal.progress
+  row_numbers = goal.get_start_order()
+  if row_numbers == None:
+    get_start = lambda position: progress[position][0]
+  else:
+    get_start = lambda position: progress[row_numbers[position]][0]
+  low = 0
+  high = len(progress)
+  while low < high:
+    middle = (low + high) // 2
+    if get_start(middle) <= start_time:
+      low = middle + 1
+    else:
+      high = middle
+  if reverse:
+    positions = range(len(progress)-1, low-1, -1)
+  else:
+    positions = range(low, len(progress))
+  for position in positions:
+    row_number = position if row_numbers == None else row_numbers[position]
+    row = progress[row_number]
+    yield (row[0], goal_order, row_number), row, goal
+
+def merge_rows_after(goals, start_time, reverse=False):
+  """
+  (row, goal) for every row starting strictly after start_time, or latest first if reverse.  Rows that start together
+  are in the order of their goals in goals, which is how sorting all of their rows by start has always left them.
+  Each goal's progress is already in order, so this is a lazy merge of one cursor per goal that has anything that
+  recent, and taking the last few rows only costs a few steps of the merge.
+  """
+  cursors = []
+  for i, goal in enumerate(goals):
+    if goal.last_updated_at == None or goal.last_updated_at <= start_time:
       continue
-    if goal.last_updated_at > start_time:
-      recent_goals.append(goal)
-  entries = []
-  for goal in recent_goals:
-    for entry in goal.progress:
-      entries.append(Entry(entry, goal))
-  entries.sort(key=lambda x: x.start_time)
-  #now merge Entry's that happened at the same time:
-  final_entries = []
-  for entry in entries:
-    if entry.start_time <= start_time:
+    cursors.append(_iter_goal_rows_after(goal, start_time, i, reverse))
+  for key, row, goal in heapq.merge(*cursors, reverse=reverse):
+    yield row, goal
+
+def _group_entries(rows):
+  """Merge (row, goal)'s that happened at the same time into MultiEntry's"""
+  group = None
+  for row, goal in rows:
+    entry = Entry(row, goal)
+    if group != None and group.is_same_time(entry):
+      group.add(entry)
       continue
-    if len(final_entries) <= 0:
-      final_entries.append(MultiEntry(entry))
-    prev_entry = final_entries[-1]
-    if prev_entry.is_same_time(entry):
-      prev_entry.add(entry)
-    else:
-      final_entries.append(MultiEntry(entry))
-  return final_entries
+    if group != None:
+      yield group
+    group = MultiEntry(entry)
+  if group != None:
+    yield group
+
+def iter_multi_entries_since(goals, start_time):
+  """MultiEntry's for every row starting after start_time, in order, made as they are asked for"""
+  goals = reach_into_archive(goals, start_time)
+  return _group_entries(get_storage().iter_rows_after(goals, start_time))
+
+def get_multi_entries_since(goals, start_time):
+  return list(iter_multi_entries_since(goals, start_time))
+
+def get_latest_multi_entries(goals, count, start_time):
+  """The last count of get_multi_entries_since(goals, start_time), read backwards from the latest row"""
+  goals = reach_into_archive(goals, start_time)
+  rows = []
+  group_count = 0
+  for row, goal in get_storage().iter_rows_after(goals, start_time, reverse=True):
+    if len(rows) <= 0 or row[0] != rows[-1][0][0] or row[1] != rows[-1][0][1]:
+      #the groups so far are complete once a row from another one turns up
+      if group_count >= count:
+        break
+      group_count += 1
+    rows.append((row, goal))
+  rows.reverse()
+  return list(_group_entries(rows))
 
 def get_entries_in_period(goals, start_time, end_time):
-  recent_goals = []
-  for goal in goals:
-    if goal.last_updated_at == None:
-      continue
-    if goal.last_updated_at > start_time:
-      recent_goals.append(goal)
-  entries = []
-  for goal in recent_goals:
-    for entry in goal.progress:
-      entry_object = Entry(entry, goal)
-      if entry_object.start_time >= start_time and entry_object.end_time <= end_time:
-        entries.append(entry_object)
-  entries.sort(key=lambda x: x.start_time)
-  return entries
+  goals = reach_into_archive(goals, start_time)
+  return [Entry(row, goal) for row, goal in get_storage().get_rows_in_period(goals, start_time, end_time)]
   
+EXPORT_FIELDS = ["start", "end", "duration", "focus", "goal_id", "description", "tags", "notes"]
+
+def _format_export_time(timestamp):
+  return datetime.datetime.fromtimestamp(float(timestamp)).isoformat(" ", "seconds")
+
+def iter_export_records(goals, start_time, end_time):
+  """A dict of EXPORT_FIELDS for each row in the period, in order, made as they are asked for"""
+  goals = reach_into_archive(goals, start_time)
+  for row, goal in get_storage().iter_rows_in_period(goals, start_time, end_time):
+    yield {"start": _format_export_time(row[0]), "end": _format_export_time(row[1]), "duration": str(row[1] - row[0]),
+      "focus": str(row[2]), "goal_id": goal.id, "description": goal.description, "tags": goal.tags, "notes": row[3]}
+
+def write_csv(records, out_file):
+  writer = csv.writer(out_file)
+  writer.writerow(EXPORT_FIELDS)
+  for record in records:
+    record["tags"] = " ".join(record["tags"])
+    writer.writerow([record[field] for field in EXPORT_FIELDS])
+
+def write_jsonl(records, out_file):
+  for record in records:
+    out_file.write(json.dumps(record) + "\n")
+
+EXPORT_FORMATS = {"csv": write_csv, "jsonl": write_jsonl}
+
+def export(goals, export_format, first_day, last_day, out_file):
+  """Write every row from the start of first_day to the end of last_day, local time, to out_file"""
+  start_time = _get_local_midnight(first_day)
+  end_time = _get_local_midnight(last_day + datetime.timedelta(days=1))
+  EXPORT_FORMATS[export_format](iter_export_records(goals, start_time, end_time), out_file)
+
+def export_command(args):
+  """--export csv|jsonl FIRST_DAY [LAST_DAY [FILE]], days as YYYY-MM-DD, to stdout unless given a FILE"""
+  if args[0] not in EXPORT_FORMATS:
+    print("Can only export to %s" % ", ".join(sorted(EXPORT_FORMATS)))
+    sys.exit(2)
+  first_day = datetime.datetime.strptime(args[1], "%Y-%m-%d").date()
+  last_day = _get_local_day(NOW)
+  if len(args) > 2:
+    last_day = datetime.datetime.strptime(args[2], "%Y-%m-%d").date()
+  goals = list(load_all_goals().values())
+  if len(args) > 3 and args[3] != "-":
+    out_file = open(args[3], "w", newline="")
+    export(goals, args[0], first_day, last_day, out_file)
+    out_file.close()
+  else:
+    export(goals, args[0], first_day, last_day, sys.stdout)
+
 def display_record(entries):
   print("\n".join([str(entry) for entry in entries]) + "\n")
 
-def handle_command_line_data(command_data):
-  commands = command_data.split('#')
-  for command in commands:
-    goal_dict = load_all_goals()
-    goals = list(goal_dict.values())
-    all_recent_goals = get_most_recent_goals(goals, NUM_TO_SHOW)
-    recent_entries = get_multi_entries_since(all_recent_goals, NOW - one_week_in_seconds)
-    display_record(recent_entries[-1*NUM_TO_SHOW:])
+#goals changed while ingesting a batch, by id, which are written once at the end instead of after every change
+_deferred_saves = None
+#{goal id: [row count when first changed, fewest rows since, completed_at when first changed]} for those goals
+_deferred_rows = {}
+
+def read_batch_commands(source):
+  """Commands from a -c argument, separated by # or newlines"""
+  commands = []
+  for line in source.splitlines():
+    commands += [command for command in line.split('#') if command.strip()]
+  return commands
+
+def ingest_commands(commands, goal_dict):
+  """
+  Apply add_time commands in order against goal_dict, each one starting where the last one ended,
+  and write every goal that changed exactly once at the end.  Returns the new entries and the changed goals.
+  """
+  recent_entries = get_latest_multi_entries(list(goal_dict.values()), 1, NOW - one_week_in_seconds)
+  prev_entry = None
+  if len(recent_entries) > 0:
     prev_entry = recent_entries[-1]
-    add_time(command, goal_dict, prev_entry)
-    all_recent_goals = get_most_recent_goals(goals, NUM_TO_SHOW)
-    recent_entries = get_multi_entries_since(all_recent_goals, NOW - one_day_in_seconds)
-    display_record(recent_entries[-10:])
+  new_entries = []
+  with _batched_saves() as changed_goals:
+    for command in commands:
+      try:
+        prev_entry = add_time(command, goal_dict, prev_entry)
+      except Exception:
+        print("Failed on command %s: %s" % (len(new_entries)+1, command))
+        raise
+      new_entries.append(prev_entry)
+  return new_entries, changed_goals
 
-NUM_TO_SHOW = 40
+@contextlib.contextmanager
+def _batched_saves():
+  """
+  Hold back saving the goals that change inside the block until it ends, then write each of them once.  Yields a
+  list that is filled in with the goals that were written
+  """
+  global _deferred_saves
+  changed_goals = []
+  _deferred_saves = {}
+  _deferred_rows.clear()
+  try:
+    yield changed_goals
+  finally:
+    #whatever made it in before a failure is still written
+    changed_goals += _deferred_saves.values()
+    _deferred_saves = None
+    for goal in changed_goals:
+      goal._save_deferred(*_deferred_rows[goal.id])
+    if _daily_rollups != None and len(changed_goals) > 0:
+      _daily_rollups.save()
+    if _packed_intervals != None and len(changed_goals) > 0:
+      _packed_intervals.save()
+    if _day_boundaries != None and len(changed_goals) > 0:
+      _day_boundaries.save()
 
-def main():
-  #this should only happen on windows
-  if os.name == 'nt':
-    os.system("mode con cols=190 lines=60")
-  # big hack to read string from the command line
-  if len(sys.argv) > 0 and sys.argv[1] == '-c':
-    handle_command_line_data(sys.argv[2])
+def handle_command_line_data(command_data, goal_dict=None):
+  commands = read_batch_commands(command_data)
+  if goal_dict == None:
+    goal_dict = load_all_goals()
+  new_entries, changed_goals = ingest_commands(commands, goal_dict)
+  display_record(new_entries)
+  total_duration = sum([entry.duration for entry in new_entries])
+  hours = int(total_duration / (60*60))
+  minutes = int((total_duration/60) - (hours*60))
+  print("Added %s entries (%.2d:%.2d) to %s goals" % (len(new_entries), hours, minutes, len(changed_goals)))
+
+#"table" to print how long each phase took when the process is done, or a file name to append it to as JSON lines
+TIMINGS_VARIABLE = "TIMELOGGER_TIMINGS"
+#a file name to dump cProfile stats to when the process is done
+CPROFILE_VARIABLE = "TIMELOGGER_CPROFILE"
+#what gets timed, by name in this module, Class.method for methods.  Times include whatever else is timed inside them
+TIMED_PHASES = [
+  #reading goals
+  "load_all_goals", "_load_goal_files", "_read_snapshot", "_write_snapshot", "Goal.load_from_file", "Goal._finish_load",
+  "replay_journal", "GoalArchive.load_goals",
+  #working out what to show
+  "get_multi_entries_since", "get_latest_multi_entries", "get_entries_in_period", "get_goal_durations",
+  "get_packed_intervals", "get_leaderboards", "Leaderboards.get_recent", "Leaderboards.get_frequent",
+  "Leaderboards.get_optimal", "get_most_recent_goals", "get_most_frequent_goals", "get_optimal_goals",
+  #showing it
+  "show_launcher", "display_record", "fancy_tri_column_print",
+  #waiting for the user, which is worth knowing to leave out
+  "prompt",
+  #command handlers
+  "add_time", "Goal.undo_add_time", "create_goal", "edit", "review", "simple_review", "weekly_review", "summarize",
+  "ingest_commands",
+  #writing goals
+  "Goal.save",
+]
+#{phase: [calls, seconds]} while timing is on, None otherwise, when nothing is wrapped and it costs nothing
+_timings = None
+_timings_output = None
+_timings_started_at = None
+
+def _timed(name, function):
+  @functools.wraps(function)
+  def timed(*args, **kwargs):
+    start = time.perf_counter()
+    try:
+      return function(*args, **kwargs)
+    finally:
+      timing = _timings[name]
+      timing[0] += 1
+      timing[1] += time.perf_counter() - start
+  return timed
+
+def enable_timings(output):
+  """Start timing each of TIMED_PHASES, to be reported to output ("table" or a file name) by report_timings"""
+  global _timings, _timings_output, _timings_started_at
+  if _timings != None:
     return
-  #read tags from args
-  tags = sys.argv[1:]
-  tag_set = set(tags)
+  _timings = {}
+  _timings_output = output
+  _timings_started_at = time.perf_counter()
+  module = sys.modules[__name__]
+  for name in TIMED_PHASES:
+    _timings[name] = [0, 0.0]
+    if "." in name:
+      class_name, attribute = name.split(".")
+      owner = getattr(module, class_name)
+      function = owner.__dict__[attribute]
+      if isinstance(function, staticmethod):
+        setattr(owner, attribute, staticmethod(_timed(name, function.__func__)))
+      else:
+        setattr(owner, attribute, _timed(name, function))
+    else:
+      setattr(module, name, _timed(name, getattr(module, name)))
+  atexit.register(report_timings)
+
+def report_timings(args=None):
+  """Print or log what was timed since the last report, then start counting again"""
+  global _timings_started_at
+  if _timings == None:
+    return
+  total = time.perf_counter() - _timings_started_at
+  phases = dict((name, timing) for name, timing in _timings.items() if timing[0] > 0)
+  if args == None:
+    args = sys.argv[1:]
+  if len(phases) > 0:
+    if _timings_output == "table":
+      #stderr, because stdout may be a client's terminal
+      out_file = sys.stderr
+      out_file.write("%s %8s %12s %12s\n" % (pad("phase", 30), "calls", "total ms", "mean ms"))
+      for name, (calls, seconds) in sorted(phases.items(), key=lambda item: item[1][1], reverse=True):
+        out_file.write("%s %8d %12.2f %12.3f\n" % (pad(name, 30), calls, seconds*1000, seconds*1000/calls))
+      out_file.write("%s %8s %12.2f\n" % (pad("whole run", 30), "", total*1000))
+    else:
+      record = {"time": time.time(), "args": args, "seconds": total,
+        "phases": dict((name, {"calls": calls, "seconds": seconds}) for name, (calls, seconds) in phases.items())}
+      out_file = open(_timings_output, "a")
+      out_file.write(json.dumps(record, sort_keys=True) + "\n")
+      out_file.close()
+  for timing in _timings.values():
+    timing[0] = 0
+    timing[1] = 0.0
+  _timings_started_at = time.perf_counter()
+
+def enable_cprofile(file_name):
+  """Profile everything from here on and dump the stats to file_name when the process is done"""
+  import cProfile
+  profile = cProfile.Profile()
+  atexit.register(lambda: (profile.disable(), profile.dump_stats(file_name)))
+  profile.enable()
+
+NUM_TO_SHOW = 40
+
+def show_launcher(tag_set, goals):
+  """Show recent entries and the three goal columns, returning the latest entries from the last week"""
   print(" ".join(tag_set) + "\n=======================================")
+  #figure out and display the most recent, with goals that were logged together listed latest updated first
+  recent_entries = get_latest_multi_entries(goals[::-1], NUM_TO_SHOW, NOW - one_week_in_seconds)
+  display_record(recent_entries)
+  #use tags to more sensibly display the most recent tasks, most frequent tasks, and highest value tasks
+  leaderboards = get_leaderboards(goals)
+  recent_goals = leaderboards.get_recent(tag_set)
+  frequent_goals = leaderboards.get_frequent(tag_set)
+  optimal_goals = leaderboards.get_optimal(tag_set)
+  #display 3 columns (60 chars each), one for each of the categories
+  fancy_tri_column_print(optimal_goals, frequent_goals, recent_goals, 60, 4)
+  return recent_entries
+
+def run_launcher(tags, goal_dict=None):
+  """Show recent entries and the three goal columns, then read and handle one command"""
+  tag_set = set(tags)
   #load all goals
-  goal_dict = load_all_goals()
+  if goal_dict == None:
+    goal_dict = load_all_goals()
   goals = list(goal_dict.values())
-  #figure out and display the most recent
-  all_recent_goals = get_most_recent_goals(goals, NUM_TO_SHOW)
-  recent_entries = get_multi_entries_since(all_recent_goals, NOW - one_week_in_seconds)
-  display_record(recent_entries[-1*NUM_TO_SHOW:])
+  #the reports list goals that were logged together in this order
+  goals.sort(key=lambda goal: goal.last_updated_at)
+  recent_entries = show_launcher(tag_set, goals)
+  prev_entry = None
   if len(recent_entries) > 0:
     prev_entry = recent_entries[-1]
-  #use tags to more sensibly display the most recent tasks, most frequent tasks, and highest value tasks
-  if len(tag_set) > 0:
-    relevant_goals = [goal for goal in goals if tag_set.issubset(set(goal.tags))]
-  else:
-    relevant_goals = goals
-  recent_goals = get_most_recent_goals(relevant_goals, NUM_TO_SHOW)
-  relevant_incomplete_goals = [goal for goal in goals if not goal.is_complete]
-  frequent_goals = get_most_frequent_goals(relevant_incomplete_goals, NUM_TO_SHOW, one_week_in_seconds)
-  optimal_goals = get_optimal_goals(relevant_incomplete_goals, NUM_TO_SHOW)
-  #display 3 columns (60 chars each), one for each of the categories
-  fancy_tri_column_print(optimal_goals, frequent_goals, recent_goals, 60, 4)
   #read command and handle
   user_data = prompt("Enter command:")
   if len(user_data) > 0 and user_data[0] == '/':
@@ -809,7 +4165,7 @@ def main():
     #this command is handled specially in the outer loop, it is the default
     if command != "/add_time":
       if command == "/create":
-        create_goal(user_data, tags)
+        create_goal(user_data, tags, goal_dict)
       elif command == "/undo":
         for entry in prev_entry.entries:
           entry.goal.undo_add_time()
@@ -829,11 +4185,562 @@ def main():
   #handle the default case (add_time)
   add_time(user_data, goal_dict, prev_entry)
   #then redisplay recent tasks, because it's nice to see  :)
-  all_recent_goals = get_most_recent_goals(goals, NUM_TO_SHOW)
-  recent_entries = get_multi_entries_since(all_recent_goals, NOW - one_day_in_seconds)
-  display_record(recent_entries[-10:])
+  goals.sort(key=lambda goal: goal.last_updated_at)
+  recent_entries = get_latest_multi_entries(goals[::-1], 10, NOW - one_day_in_seconds)
+  display_record(recent_entries)
   #finally, prompt for any input so that the window doesnt close instantly
   input()
+
+def run(args, goal_dict=None):
+  """Handle one invocation, args being everything after the script name"""
+  # big hack to read string from the command line
+  if len(args) > 0 and args[0] == '-c':
+    handle_command_line_data(args[1], goal_dict)
+    return
+  #same thing, but from a file, or stdin for -
+  if len(args) > 0 and args[0] == '-f':
+    if args[1] == '-':
+      command_data = sys.stdin.read()
+    else:
+      in_file = open(args[1], "r")
+      command_data = in_file.read()
+      in_file.close()
+    handle_command_line_data(command_data, goal_dict)
+    return
+  if len(args) > 0 and args[0] == '--rebuild-cache':
+    rebuild_snapshot()
+    return
+  if len(args) > 0 and args[0] == '--watch':
+    watch_goals()
+    return
+  if len(args) > 0 and args[0] == '--verify-intervals':
+    verify_packed_intervals()
+    return
+  if len(args) > 0 and args[0] == '--verify-rollups':
+    verify_daily_rollups()
+    return
+  if len(args) > 0 and args[0] == '--verify-days':
+    verify_day_boundaries()
+    return
+  if len(args) > 0 and args[0] == '--stress-test':
+    counts = [int(arg) for arg in args[1:3]]
+    mode = args[3] if len(args) > 3 else None
+    if not stress_test(*counts, mode=mode):
+      sys.exit(1)
+    return
+  if len(args) > 5 and args[0] == '--stress-worker':
+    _stress_worker(args[1], args[2], int(args[3]), int(args[4]), float(args[5]))
+    return
+  if len(args) > 2 and args[0] == '--migrate-storage':
+    migrate_storage(args[1], args[2])
+    return
+  if len(args) > 0 and args[0] == '--migrate-format':
+    migrate_goal_format()
+    return
+  if len(args) > 1 and args[0] == '--export':
+    export_command(args[1:])
+    return
+  if len(args) > 0 and args[0] == '--archive':
+    archive_goals(*[int(arg) for arg in args[1:2]])
+    return
+  if len(args) > 0 and args[0] == '--compact-journal':
+    load_all_goals()
+    compact_journal()
+    return
+  #read tags from args
+  run_launcher(args, goal_dict)
+
+def _make_stress_goal(description, tags):
+  goal = Goal()
+  goal.id = Goal.allocate_id()
+  goal.created_at = NOW
+  goal.description = description
+  goal.tags = tags
+  goal.value_components = {"default": [decimal.Decimal(1), decimal.Decimal(1)]}
+  goal.time_components = {"default": [decimal.Decimal(1), decimal.Decimal(1)]}
+  goal.save()
+  return goal
+
+#how stress_test saves the rows: straight away, through the journal, or in batches the way -c does
+STRESS_MODES = ("save", "journal", "batch")
+#rows in each batch in batch mode
+STRESS_BATCH_SIZE = 4
+
+def _stress_worker(storage_name, mode, worker, rounds, start_at):
+  """One of the processes started by stress_test"""
+  global STORAGE, USE_PROGRESS_JOURNAL, JOURNAL_COMPACT_AT
+  STORAGE = storage_name
+  if mode == "journal":
+    USE_PROGRESS_JOURNAL = True
+    #so that compactions happen often, and race with each other and with appends
+    JOURNAL_COMPACT_AT = 7
+  batch_size = STRESS_BATCH_SIZE if mode == "batch" else 1
+  goal_dict = load_all_goals()
+  shared_goals = sorted([goal for goal in goal_dict.values() if "shared" in goal.tags], key=lambda goal: goal.id)
+  #everybody starts together, to make the collisions as likely as possible
+  time.sleep(max(0, start_at - time.time()))
+  for first in range(0, rounds, batch_size):
+    batch = range(first, min(first + batch_size, rounds))
+    with _batched_saves() if mode == "batch" else contextlib.nullcontext():
+      for i in batch:
+        goal = shared_goals[i % len(shared_goals)]
+        start_time = NOW + worker*rounds + i
+        goal.add_time(start_time, start_time + 1, decimal.Decimal(1), "worker %s round %s" % (worker, i), False)
+    for i in batch:
+      if i % 4 == 0:
+        _make_stress_goal("worker %s goal %s" % (worker, i), ["stress"])
+
+def stress_test(process_count=8, rounds=40, mode=None):
+  """
+  Start process_count processes that all log time to the same few goals, and create goals of their own, at the same
+  time in a scratch directory, then check that every row and goal that any of them wrote is there exactly once.  Runs
+  once for each of STRESS_MODES unless given one
+  """
+  if mode == None:
+    return all([stress_test(process_count, rounds, mode) for mode in STRESS_MODES])
+  directory = tempfile.mkdtemp(prefix="timelogger-stress-")
+  previous_directory = os.getcwd()
+  os.chdir(directory)
+  #storage opened before now, or by an earlier run, points into some other directory
+  _storages.clear()
+  problems = []
+  try:
+    os.makedirs("goals")
+    get_storage().set_next_id(0)
+    for i in range(3):
+      _make_stress_goal("shared %s" % i, ["shared"])
+    start_at = time.time() + 1
+    import subprocess
+    workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--stress-worker", STORAGE, mode, str(worker), str(rounds), repr(start_at)])
+      for worker in range(process_count)]
+    for worker, process in enumerate(workers):
+      if process.wait() != 0:
+        problems.append("worker %s exited with %s" % (worker, process.returncode))
+    try:
+      goals = list(load_all_goals(use_cache=False).values())
+    except Exception as error:
+      goals = []
+      problems.append("could not load the goals back: %s" % error)
+    found = collections.Counter()
+    for goal in goals:
+      if "shared" in goal.tags:
+        found.update(row[3] for row in goal.progress)
+      else:
+        found[goal.description] += 1
+    expected = []
+    for worker in range(process_count):
+      for i in range(rounds):
+        expected.append("worker %s round %s" % (worker, i))
+        if i % 4 == 0:
+          expected.append("worker %s goal %s" % (worker, i))
+    for name in expected:
+      if found[name] != 1:
+        problems.append("%s was written %s times" % (name, found[name]))
+    if len(goals) > 0 and get_storage().get_next_id() != len(goals):
+      problems.append("next id is %s with %s goals" % (get_storage().get_next_id(), len(goals)))
+    print("%s processes, %s rounds each, %s storage, %s mode" % (process_count, rounds, STORAGE, mode))
+    for problem in problems:
+      print(problem)
+    if len(problems) <= 0:
+      print("Nothing was lost")
+  finally:
+    os.chdir(previous_directory)
+    _storages.clear()
+    import shutil
+    shutil.rmtree(directory, ignore_errors=True)
+  return len(problems) <= 0
+
+#how often the polling watcher looks at the goal files, where inotify isn't available
+WATCH_POLL_SECONDS = 1.0
+#goal files that could not be parsed, with the signature they had, so that each bad version is only reported once
+_unreadable_files = {}
+
+class PollingWatcher():
+  """Finds changed goal files by comparing the signature of every file against the one it had when it was loaded"""
+  def get_changes(self):
+    """Names of goal files that were changed, added or deleted since they were loaded"""
+    file_names = get_goal_file_names()
+    changed = set(_loaded_files.keys()).symmetric_difference(file_names)
+    for file_name in file_names:
+      known = _loaded_files.get(file_name)
+      try:
+        if known != None and known[0] != _get_file_signature(file_name):
+          changed.add(file_name)
+      except OSError:
+        #deleted since the glob
+        changed.add(file_name)
+    return sorted(changed)
+
+  def wait(self, timeout):
+    time.sleep(timeout)
+
+  def close(self):
+    pass
+
+class InotifyWatcher():
+  """Finds changed goal files from what the kernel reports, so that the files that didn't change are never looked at"""
+  IN_CLOSE_WRITE = 0x8
+  IN_MOVED_FROM = 0x40
+  IN_MOVED_TO = 0x80
+  IN_DELETE = 0x200
+  IN_Q_OVERFLOW = 0x4000
+  #struct inotify_event, which is followed by a name of len bytes
+  EVENT = struct.Struct("iIII")
+
+  def __init__(self, directory="goals"):
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    self.directory = directory
+    self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    #saves rename a new file into place and editors may write in place, creating a file is always followed by a close
+    mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE
+    if libc.inotify_add_watch(self.fd, directory.encode("utf-8"), mask) < 0:
+      error = ctypes.get_errno()
+      os.close(self.fd)
+      raise OSError(error, "inotify_add_watch failed for %s" % directory)
+
+  def get_changes(self):
+    """Names of goal files that were changed, added or deleted since the last call"""
+    file_names = set()
+    overflowed = False
+    while True:
+      try:
+        data = os.read(self.fd, 65536)
+      except BlockingIOError:
+        break
+      offset = 0
+      while offset < len(data):
+        wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+        offset += self.EVENT.size
+        name = data[offset:offset+length].rstrip(b"\0").decode("utf-8", "replace")
+        offset += length
+        if mask & self.IN_Q_OVERFLOW:
+          overflowed = True
+        elif name.endswith(".json"):
+          file_names.add(self.directory + "/" + name)
+    if overflowed:
+      #the kernel dropped events, so look at every file instead
+      return PollingWatcher().get_changes()
+    return sorted(file_names)
+
+  def wait(self, timeout):
+    """Until something happens to the goal files, or timeout seconds go by"""
+    import select
+    select.select([self.fd], [], [], timeout)
+
+  def close(self):
+    os.close(self.fd)
+
+def get_watcher():
+  """Something to ask which goal files changed: inotify on Linux, otherwise looking at every file"""
+  if sys.platform.startswith("linux"):
+    try:
+      return InotifyWatcher()
+    except (OSError, AttributeError):
+      #no inotify, or out of watches
+      pass
+  return PollingWatcher()
+
+def apply_goal_file_changes(goal_dict, file_names):
+  """
+  Re-read whichever of file_names changed since they were loaded, and patch every derived view to match rather than
+  rebuilding them.  A file that can't be parsed is reported, and its goal keeps its last good state until it can be.
+  Returns lists of the file names that were reloaded, added and removed, and of the errors.
+  """
+  reloaded, added, removed, errors = [], [], [], []
+  #(old goal or None, new goal or None)
+  changes = []
+  for file_name in sorted(set(file_names)):
+    known = _loaded_files.get(file_name)
+    try:
+      signature = _get_file_signature(file_name)
+    except FileNotFoundError:
+      _unreadable_files.pop(file_name, None)
+      if known != None:
+        del _loaded_files[file_name]
+        if known[1] in goal_dict:
+          changes.append((goal_dict.pop(known[1]), None))
+          removed.append(file_name)
+      continue
+    if (known != None and known[0] == signature) or _unreadable_files.get(file_name) == signature:
+      #our own save, or a bad version that was already reported
+      continue
+    try:
+      goal = Goal.load_from_file(file_name)
+    except (ValueError, OSError) as error:
+      _unreadable_files[file_name] = signature
+      errors.append(str(error))
+      continue
+    _unreadable_files.pop(file_name, None)
+    _loaded_files[file_name] = (signature, goal.id)
+    if known != None and known[1] != goal.id and known[1] in goal_dict:
+      changes.append((goal_dict.pop(known[1]), None))
+    old_goal = goal_dict.get(goal.id)
+    goal_dict[goal.id] = goal
+    changes.append((old_goal, goal))
+    if old_goal == None:
+      added.append(file_name)
+    else:
+      reloaded.append(file_name)
+  if len(changes) > 0:
+    #goals still in memory already have their journal records applied, so this only touches re-read ones
+    replay_journal(goal_dict)
+    forget_archive()
+    archive = get_archive()
+    if archive != None and any(new_goal == None and old_goal.id in archive.goals for old_goal, new_goal in changes):
+      #moved into the archive rather than deleted, which the views have to keep counting
+      reset_derived_views()
+    else:
+      for old_goal, new_goal in changes:
+        if new_goal == None:
+          _notify_goal_removed(old_goal)
+        elif old_goal == None:
+          _notify_goal_added(new_goal)
+        else:
+          _notify_goal_replaced(old_goal, new_goal)
+  return reloaded, added, removed, errors
+
+def refresh_watched_goals(goal_dict, watcher):
+  """refresh_goals, only looking at the goal files that watcher saw change when it can"""
+  file_names = watcher.get_changes()
+  if _get_journal_signature() != _journal_signature:
+    #another process journaled progress, which belongs to goals whose files may not have changed at all
+    refresh_goals(goal_dict)
+    return
+  reloaded, added, removed, errors = apply_goal_file_changes(goal_dict, file_names)
+  for error in errors:
+    print(error)
+
+def watch_goals():
+  """Report goal files as they change, keeping the loaded goals and their views current, until interrupted"""
+  if not isinstance(get_storage(), JsonDirectoryStorage):
+    print("Only goal files can be watched, not %s storage" % STORAGE)
+    return
+  #before loading, so that nothing written in between is missed
+  watcher = get_watcher()
+  goal_dict = load_all_goals()
+  print("Watching %s goals with %s" % (len(goal_dict), type(watcher).__name__))
+  try:
+    while True:
+      watcher.wait(WATCH_POLL_SECONDS)
+      reloaded, added, removed, errors = apply_goal_file_changes(goal_dict, watcher.get_changes())
+      for label, file_names in (("reloaded", reloaded), ("added", added), ("removed", removed)):
+        for file_name in file_names:
+          print("%s %s" % (label, file_name))
+      for error in errors:
+        print(error)
+      sys.stdout.flush()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    watcher.close()
+
+SOCKET_FILE = "goals/server.sock"
+
+def serve():
+  """Keep the goals and everything derived from them in memory, and run the commands that --client sends"""
+  global USE_COLUMNAR_PROGRESS
+  #the server builds it once and keeps it, so it is worth having whenever numpy is around
+  USE_COLUMNAR_PROGRESS = bool(_import_numpy())
+  watcher = None
+  if isinstance(get_storage(), JsonDirectoryStorage):
+    #before loading, so that nothing written in between is missed
+    watcher = get_watcher()
+  goal_dict = load_all_goals()
+  import socket
+  if os.path.exists(SOCKET_FILE):
+    os.remove(SOCKET_FILE)
+  listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  listener.bind(SOCKET_FILE)
+  listener.listen(5)
+  print("Serving %s goals on %s" % (len(goal_dict), SOCKET_FILE))
+  import threading
+  #held by whichever command is running, which is let go while it waits for its user, see ClientInput
+  lock = threading.Lock()
+  def serve_and_close(connection):
+    try:
+      _serve_connection(connection, goal_dict, watcher, lock)
+    finally:
+      connection.close()
+  try:
+    while True:
+      connection = listener.accept()[0]
+      thread = threading.Thread(target=serve_and_close, args=(connection,))
+      thread.daemon = True
+      thread.start()
+  finally:
+    if watcher != None:
+      watcher.close()
+    listener.close()
+    os.remove(SOCKET_FILE)
+
+#commands that change the process itself or run until they are stopped, which the server won't run for a client
+LOCAL_ONLY_COMMANDS = ('--serve', '--client', '--watch', '--stress-test', '--stress-worker', '--migrate-storage', '--migrate-format')
+
+def _get_exit_code(error):
+  """The status that a SystemExit would have ended the process with"""
+  if error.code == None:
+    return 0
+  if isinstance(error.code, int):
+    return error.code
+  #sys.exit("message") prints the message and fails
+  print(error.code)
+  return 1
+
+class ClientInput():
+  """
+  A client's connection standing in for stdin.  The server lock is let go while waiting for the user to type, so that
+  a launcher left open doesn't hold up every other client, and the terminal and NOW are put back once it is held again
+  """
+  def __init__(self, reader, writer, lock, server_terminal):
+    self.reader = reader
+    self.writer = writer
+    self.lock = lock
+    #(stdin, stdout) of the server, for whoever runs next
+    self.server_terminal = server_terminal
+
+  def _wait(self, read):
+    global NOW
+    terminal = (sys.stdin, sys.stdout, NOW)
+    self.writer.flush()
+    sys.stdin, sys.stdout = self.server_terminal
+    self.lock.release()
+    try:
+      return read()
+    finally:
+      self.lock.acquire()
+      sys.stdin, sys.stdout, NOW = terminal
+
+  def readline(self):
+    return self._wait(self.reader.readline)
+
+  def read(self):
+    return self._wait(self.reader.read)
+
+def _serve_connection(connection, goal_dict, watcher=None, lock=None):
+  """
+  Run one client's command with the connection standing in for the terminal.  The output is followed by a NUL and
+  the command's exit status, which run_client hands on.  Commands from other connections only run while this one is
+  waiting for its user, with lock held the rest of the time.
+  """
+  global NOW
+  if lock == None:
+    import threading
+    lock = threading.Lock()
+  reader = connection.makefile("r")
+  writer = connection.makefile("w")
+  request = json.loads(reader.readline())
+  args = request["args"]
+  lock.acquire()
+  NOW = decimal.Decimal(str(time.time()))
+  stdin, stdout = sys.stdin, sys.stdout
+  sys.stdin, sys.stdout = ClientInput(reader, writer, lock, (stdin, stdout)), writer
+  exit_code = 0
+  try:
+    if len(args) > 0 and args[0] in LOCAL_ONLY_COMMANDS:
+      print("%s has to be run without --client" % args[0])
+      exit_code = 2
+    else:
+      #goal files are still the source of truth, and anyone may have written them since the last command
+      if watcher != None:
+        refresh_watched_goals(goal_dict, watcher)
+      else:
+        refresh_goals(goal_dict)
+      run(args, goal_dict)
+  except (EOFError, OSError):
+    #the client went away
+    pass
+  except SystemExit as error:
+    #the command gave up, which mustn't take the server down with it
+    exit_code = _get_exit_code(error)
+  except Exception:
+    traceback.print_exc(file=writer)
+    exit_code = 1
+  finally:
+    sys.stdin, sys.stdout = stdin, stdout
+    report_timings(args)
+    lock.release()
+  try:
+    writer.write("\0%s\n" % exit_code)
+    writer.flush()
+  except OSError:
+    pass
+
+def run_client(args):
+  """Act as the terminal for a command run by the server.  Returns its exit status, or None when there is no server"""
+  #imported here, so that commands run without --client don't pay for them
+  import socket
+  import threading
+  if not hasattr(socket, "AF_UNIX"):
+    return None
+  connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    connection.connect(SOCKET_FILE)
+  except OSError:
+    connection.close()
+    return None
+  connection.sendall((json.dumps({"args": args}) + "\n").encode("utf-8"))
+  def forward_input():
+    try:
+      for line in iter(sys.stdin.readline, ""):
+        connection.sendall(line.encode("utf-8"))
+      #so that a command waiting for more input gets an end of file, the same as it would without --client
+      connection.shutdown(socket.SHUT_WR)
+    except OSError:
+      return
+  input_thread = threading.Thread(target=forward_input)
+  input_thread.daemon = True
+  input_thread.start()
+  #everything after the NUL is the exit status
+  status = None
+  while True:
+    data = connection.recv(4096)
+    if not data:
+      break
+    if status != None:
+      status += data
+      continue
+    if b"\0" in data:
+      data, status = data.split(b"\0", 1)
+    sys.stdout.buffer.write(data)
+    sys.stdout.flush()
+  connection.close()
+  if status == None:
+    #the server went away before the command finished
+    return 1
+  return int(status.strip())
+
+def main():
+  #this should only happen on windows
+  if os.name == 'nt':
+    os.system("mode con cols=190 lines=60")
+  args = sys.argv[1:]
+  timings = os.environ.get(TIMINGS_VARIABLE)
+  profile_file_name = os.environ.get(CPROFILE_VARIABLE)
+  while len(args) > 1 and args[0] in ('--timings', '--cprofile'):
+    if args[0] == '--timings':
+      timings = args[1]
+    else:
+      profile_file_name = args[1]
+    args = args[2:]
+  if timings:
+    enable_timings(timings)
+  if profile_file_name:
+    enable_cprofile(profile_file_name)
+  if len(args) > 0 and args[0] == '--serve':
+    serve()
+    return
+  if len(args) > 0 and args[0] == '--client':
+    args = args[1:]
+    if len(args) <= 0 or args[0] not in LOCAL_ONLY_COMMANDS:
+      exit_code = run_client(args)
+      if exit_code != None:
+        sys.exit(exit_code)
+    #no server running, or a command it won't run, just do it ourselves
+  run(args)
     
 if __name__ == "__main__":
   main()